@@ -1,5 +1,5 @@
 import argparse
-import copy
+import functools
 import json
 import logging
 import math
@@ -7,9 +7,10 @@ import os
 import random
 import sys
 import tempfile
+import threading
 import time
-from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from hashlib import sha256
 from pathlib import Path
 from string import Template
@@ -18,6 +19,12 @@ import boto3
 import botocore.exceptions
 import networkx as nx
 import yaml
+from botocore.config import Config
+
+try:
+    from yaml import CSafeLoader as YAML_LOADER
+except ImportError:
+    from yaml import SafeLoader as YAML_LOADER
 
 _logger = logging.getLogger(__name__)
 
@@ -27,19 +34,36 @@ POEMAI_TIMESTAMP_KEY = "__poemai_timestamp__"
 STACK_STABLE_STATE_POLL_INTERVAL_SECONDS = 10
 DEFAULT_STACK_STABLE_STATE_TIMEOUT_SECONDS = 300
 DEFAULT_CLOUDFRONT_STACK_STABLE_STATE_TIMEOUT_SECONDS = 1800
-for tag in ["!Ref", "!GetAtt", "!Sub", "!GetAZs"]:
-    yaml.SafeLoader.add_constructor(
-        tag, lambda loader, node: f"{tag[1:]}({loader.construct_scalar(node)})"
-    )
-# Update !ImportValue to handle mappings
-yaml.SafeLoader.add_constructor(
-    "!ImportValue",
-    lambda loader, node: f"ImportValue({loader.construct_mapping(node) if isinstance(node, yaml.MappingNode) else loader.construct_scalar(node)})",
+# Upper bound for concurrent stack deployments (Lambda invoke + stable state polling)
+MAX_PARALLEL_STACK_DEPLOYMENTS = 32
+# Share of the account's concurrent executions a deployment may use
+LAMBDA_CONCURRENCY_SAFETY_FACTOR = 4
+# botocore keeps 10 pooled connections by default, size the pool for all deploy
+# workers so parallel invokes reuse their connections instead of reconnecting
+LAMBDA_CLIENT_CONFIG = Config(
+    max_pool_connections=MAX_PARALLEL_STACK_DEPLOYMENTS,
+    tcp_keepalive=True,
+)
+# Stable state polling shares one CloudFormation client per region across workers
+CLOUDFORMATION_CLIENT_CONFIG = Config(
+    max_pool_connections=MAX_PARALLEL_STACK_DEPLOYMENTS,
 )
-for tag in ["!Select"]:
-    yaml.SafeLoader.add_constructor(
-        tag, lambda loader, node: f"{tag[1:]}({loader.construct_sequence(node)})"
+# Register the CloudFormation tags on the pure-Python loader and, if available,
+# on the LibYAML based one as well, each loader class keeps its own registry
+for loader_class in {yaml.SafeLoader, YAML_LOADER}:
+    for tag in ["!Ref", "!GetAtt", "!Sub", "!GetAZs"]:
+        loader_class.add_constructor(
+            tag, lambda loader, node: f"{tag[1:]}({loader.construct_scalar(node)})"
+        )
+    # Update !ImportValue to handle mappings
+    loader_class.add_constructor(
+        "!ImportValue",
+        lambda loader, node: f"ImportValue({loader.construct_mapping(node) if isinstance(node, yaml.MappingNode) else loader.construct_scalar(node)})",
     )
+    for tag in ["!Select"]:
+        loader_class.add_constructor(
+            tag, lambda loader, node: f"{tag[1:]}({loader.construct_sequence(node)})"
+        )
 
 
 def load_globals_from_file(file_path):
@@ -79,6 +103,25 @@ def compare_stack_names(stack_name1, stack_name2):
     )
 
 
+def build_stack_name_index(stack_names):
+    """
+    Index stack names by their name without environment suffix.
+
+    Matching a filter against all stacks then is a single dict lookup of
+    strip_environment_suffix(filter) instead of a compare_stack_names call per stack.
+
+    Parameters:
+    stack_names (iterable of str): Stack names, with or without environment suffix.
+
+    Returns:
+    dict: Stripped stack name -> list of matching stack names, in input order.
+    """
+    index = {}
+    for stack_name in stack_names:
+        index.setdefault(strip_environment_suffix(stack_name), []).append(stack_name)
+    return index
+
+
 def kebap_to_snake_case(name):
     """
     Convert kebab-case to snake_case.
@@ -115,6 +158,33 @@ def calc_stack_name(stack_name, config_global_environment):
     return stack_name
 
 
+def load_yaml_file(path):
+    """Parse a YAML file, config and versions files are only read once per run."""
+    with open(path, "rb") as file:
+        return yaml.load(file, Loader=YAML_LOADER)
+
+
+@functools.lru_cache(maxsize=512)
+def _load_template_cached(path, mtime_ns, size):
+    with open(path, "r") as file:
+        template_body = file.read()
+    return template_body, yaml.load(template_body, Loader=YAML_LOADER)
+
+
+def load_template_file(path):
+    """Read a CloudFormation template, returning its text and parsed content.
+
+    Stacks sharing a template_file read and parse it once per (path, mtime,
+    size). The parsed content is shared between callers and must not be modified.
+    """
+    stat = os.stat(path)
+    return _load_template_cached(os.fspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+def clear_yaml_cache():
+    _load_template_cached.cache_clear()
+
+
 def load_config(config_file):
     if not os.path.exists(config_file):
         raise ValueError(f"Config file {config_file} not found")
@@ -124,8 +194,7 @@ def load_config(config_file):
             config = json.load(file)
     elif config_file.endswith(".yaml"):
         try:
-            with open(config_file, "r") as file:
-                config = yaml.safe_load(file)
+            config = load_yaml_file(config_file)
 
         except yaml.YAMLError as exc:
             print(f"YAML parsing error: {exc}")
@@ -774,11 +843,8 @@ def create_message(
 
     stack.pop("stack_name", None)
 
-    with open(template_file, "r") as file:
-        template_body = file.read()
-
     try:
-        template_content = yaml.safe_load(template_body)
+        template_body, template_content = load_template_file(template_file)
     except Exception as e:
         _logger.error(f"Error parsing template {template_file}: {e}", exc_info=True)
         sys.exit(1)
@@ -985,8 +1051,7 @@ def prepare_messages(config, config_file):
             raise FileNotFoundError(
                 f"repo_versions_file {repo_versions_file} not found."
             )
-        with open(version_path, "r") as f:
-            repo_versions = yaml.safe_load(f).get("versions", {})
+        repo_versions = load_yaml_file(version_path).get("versions", {})
 
     referenced_globals = set([POEMAI_TIMESTAMP_KEY])  # Track referenced globals
 
@@ -1192,7 +1257,13 @@ def prepare_messages(config, config_file):
 
 
 def invoke_lambda_with_backoff(
-    lambda_client, function_name, payload, max_attempts=8, initial_delay=1, info=None
+    lambda_client,
+    function_name,
+    payload,
+    max_attempts=8,
+    initial_delay=1,
+    info=None,
+    on_throttle=None,
 ):
     info_text = f" ({info}) " if info else ""
 
@@ -1203,17 +1274,16 @@ def invoke_lambda_with_backoff(
                 InvocationType="RequestResponse",
                 Payload=json.dumps(payload),
             )
-            # Read the payload from the response
-            response_payload = (
-                response["Payload"].read().decode("utf-8")
-            )  # Decoding from bytes to string
+            # Read the payload from the response, json.loads accepts the UTF-8
+            # bytes directly so they are only decoded when they are not JSON
+            raw_payload = response["Payload"].read()
             try:
-                _logger.info(f"Response payload: {response_payload}")
-                response_payload = json.loads(
-                    response_payload
-                )  # Convert string to JSON if possible
+                response_payload = json.loads(raw_payload)
             except json.JSONDecodeError:
-                pass  # Keep as string if it's not JSON
+                response_payload = raw_payload.decode(
+                    "utf-8"
+                )  # Keep as string if it's not JSON
+            _logger.info(f"Response payload: {response_payload}")
 
             response["Payload"] = (
                 response_payload  # Replace the StreamingBody with the actual content
@@ -1223,6 +1293,10 @@ def invoke_lambda_with_backoff(
             lambda_client.exceptions.TooManyRequestsException,
             botocore.exceptions.ReadTimeoutError,
         ) as e:
+            if on_throttle is not None and isinstance(
+                e, lambda_client.exceptions.TooManyRequestsException
+            ):
+                on_throttle()
             if attempt < max_attempts - 1:
                 sleep_time = initial_delay * (2**attempt) + random.uniform(0, 1)
                 time.sleep(sleep_time)
@@ -1271,6 +1345,7 @@ def wait_for_stack_stable_state(
     region=None,
     timeout_seconds=DEFAULT_STACK_STABLE_STATE_TIMEOUT_SECONDS,
     poll_interval_seconds=STACK_STABLE_STATE_POLL_INTERVAL_SECONDS,
+    cf_client=None,
 ):
     region_to_use = region or "eu-central-2"
     _logger.info(
@@ -1278,7 +1353,8 @@ def wait_for_stack_stable_state(
         f"(timeout={timeout_seconds}s, poll_interval={poll_interval_seconds}s)"
     )
 
-    cf_client = boto3.client("cloudformation", region_name=region_to_use)
+    if cf_client is None:
+        cf_client = boto3.client("cloudformation", region_name=region_to_use)
 
     num_retries = max(1, math.ceil(timeout_seconds / poll_interval_seconds))
     stack_status = None
@@ -1314,7 +1390,13 @@ def wait_for_stack_stable_state(
     raise ValueError(f"Stack never reached stable state, is in state {stack_status}")
 
 
-def deploy_stack(lambda_client, lambda_function_name, message_spec):
+def deploy_stack(
+    lambda_client,
+    lambda_function_name,
+    message_spec,
+    on_throttle=None,
+    cf_client=None,
+):
 
     stack_name = message_spec["message"]["stack_name"]
     region = message_spec["message"].get("region")
@@ -1329,13 +1411,18 @@ def deploy_stack(lambda_client, lambda_function_name, message_spec):
             + (f" (region: {region})" if region else "")
         )
         retval = invoke_lambda_with_backoff(
-            lambda_client, lambda_function_name, lambda_event, info=stack_name
+            lambda_client,
+            lambda_function_name,
+            lambda_event,
+            info=stack_name,
+            on_throttle=on_throttle,
         )
 
         state = wait_for_stack_stable_state(
             stack_name,
             region,
             timeout_seconds=stable_state_timeout_seconds,
+            cf_client=cf_client,
         )
 
         _logger.info(f"Stack {stack_name} reached stable state {state}")
@@ -1347,8 +1434,49 @@ def deploy_stack(lambda_client, lambda_function_name, message_spec):
         raise e
 
 
-def deploy(lambda_function_name, config, config_file, stack_name=None):
-    lambda_client = boto3.client("lambda", region_name="eu-central-2")
+def _compute_concurrency(lambda_client):
+    """Derive the number of parallel stack deployments from the account's Lambda concurrency."""
+    try:
+        account_settings = lambda_client.get_account_settings()
+        concurrent_executions = account_settings["AccountLimit"]["ConcurrentExecutions"]
+    except botocore.exceptions.ClientError as e:
+        # The deploy role does not need lambda:GetAccountSettings, missing it is expected
+        log = (
+            _logger.debug
+            if e.response.get("Error", {}).get("Code") == "AccessDeniedException"
+            else _logger.warning
+        )
+        log(
+            f"Could not read Lambda account settings, using {MAX_PARALLEL_STACK_DEPLOYMENTS} parallel deployments: {e}"
+        )
+        return MAX_PARALLEL_STACK_DEPLOYMENTS
+    except (botocore.exceptions.BotoCoreError, KeyError) as e:
+        _logger.warning(
+            f"Could not read Lambda account settings, using {MAX_PARALLEL_STACK_DEPLOYMENTS} parallel deployments: {e}"
+        )
+        return MAX_PARALLEL_STACK_DEPLOYMENTS
+
+    concurrency = concurrent_executions // LAMBDA_CONCURRENCY_SAFETY_FACTOR
+    concurrency = max(1, min(concurrency, MAX_PARALLEL_STACK_DEPLOYMENTS))
+    _logger.info(
+        f"Account allows {concurrent_executions} concurrent executions, deploying up to {concurrency} stacks in parallel"
+    )
+    return concurrency
+
+
+def deploy(
+    lambda_function_name,
+    config,
+    config_file,
+    stack_name=None,
+    max_workers=None,
+):
+    # A single client is shared by all worker threads, boto3 clients are thread-safe
+    lambda_client = boto3.client(
+        "lambda", region_name="eu-central-2", config=LAMBDA_CLIENT_CONFIG
+    )
+    if max_workers is None:
+        max_workers = _compute_concurrency(lambda_client)
     message_generations, dependency_graph = prepare_messages(config, config_file)
 
     total_messages = sum([len(mg) for mg in message_generations])
@@ -1361,9 +1489,10 @@ def deploy(lambda_function_name, config, config_file, stack_name=None):
     all_stack_names = [message["message"]["stack_name"] for message in all_messages]
 
     if stack_name is not None:
-        found_stack_name = next(
-            (sn for sn in all_stack_names if compare_stack_names(sn, stack_name)), None
+        matching_stack_names = build_stack_name_index(all_stack_names).get(
+            strip_environment_suffix(stack_name)
         )
+        found_stack_name = matching_stack_names[0] if matching_stack_names else None
 
         if found_stack_name is None:
             raise ValueError(
@@ -1374,49 +1503,88 @@ def deploy(lambda_function_name, config, config_file, stack_name=None):
 
     successful_stacks = set()
 
-    for i, generation in enumerate(message_generations):
-        _logger.info(
-            f"*** Deploying generation {i}, stacks: {[m['message']['stack_name'] for m in generation]}"
+    if stack_name is not None:
+        # Deploy just the selected stack, its dependencies are not checked
+        stacks_to_deploy = [
+            message_spec
+            for message_spec in all_messages
+            if message_spec["message"]["stack_name"] == stack_name
+        ]
+        dependents = {stack_name: []}
+        pending_dependency_count = {stack_name: 0}
+    else:
+        stacks_to_deploy = all_messages
+        # Kahn's algorithm: dependents per stack (the edges of the dependency graph
+        # point from a stack to its dependencies) and the number of dependencies
+        # that still have to be deployed before a stack becomes ready.
+        dependents = {
+            message_spec["message"]["stack_name"]: [] for message_spec in all_messages
+        }
+        pending_dependency_count = {}
+        for stack_to_deploy in dependents:
+            dependencies = list(dependency_graph.successors(stack_to_deploy))
+            pending_dependency_count[stack_to_deploy] = len(dependencies)
+            for dependency in dependencies:
+                dependents[dependency].append(stack_to_deploy)
+
+    message_spec_by_stack = {
+        message_spec["message"]["stack_name"]: message_spec
+        for message_spec in stacks_to_deploy
+    }
+    # One CloudFormation client per region instead of one per stack, the
+    # stack status itself is only read after the lambda has been invoked
+    cf_clients = {
+        region: boto3.client(
+            "cloudformation",
+            region_name=region,
+            config=CLOUDFORMATION_CLIENT_CONFIG,
         )
+        for region in {
+            message_spec["message"].get("region") or "eu-central-2"
+            for message_spec in stacks_to_deploy
+        }
+    }
+    ready_stacks = deque(
+        name for name, count in pending_dependency_count.items() if count == 0
+    )
 
-        eligible_stacks = []
-        for stack_candidate in generation:
-            descendants = nx.descendants(
-                dependency_graph, stack_candidate["message"]["stack_name"]
-            )
-
-            if (
-                not all([d in successful_stacks for d in descendants])
-                and not stack_name
-            ):
-                missing_dependencies = [
-                    d for d in descendants if d not in successful_stacks
-                ]
-                error_msg = (
-                    f"Cannot deploy {stack_candidate['message']['stack_name']} because the following "
-                    f"dependencies have not been successfully deployed: {missing_dependencies}. "
-                    f"This indicates a deployment failure in earlier generations."
+    # Set by the workers when an invoke is throttled, the scheduler then halves
+    # the number of stacks it keeps in flight
+    throttled = threading.Event()
+    concurrency_limit = max_workers
+
+    # One pool for the whole deployment, a stack is submitted as soon as all of
+    # its dependencies have been deployed successfully
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        future_to_stack = {}
+        while ready_stacks or future_to_stack:
+            if throttled.is_set():
+                throttled.clear()
+                if concurrency_limit > 1:
+                    concurrency_limit = max(1, concurrency_limit // 2)
+                    _logger.info(
+                        f"Lambda invocations are throttled, deploying at most {concurrency_limit} stacks in parallel"
+                    )
+            if ready_stacks and len(future_to_stack) < concurrency_limit:
+                _logger.info(f"*** Deploying stacks: {list(ready_stacks)}")
+            while ready_stacks and len(future_to_stack) < concurrency_limit:
+                message_spec = message_spec_by_stack[ready_stacks.popleft()]
+                future = executor.submit(
+                    deploy_stack,
+                    lambda_client,
+                    lambda_function_name,
+                    message_spec,
+                    on_throttle=throttled.set,
+                    cf_client=cf_clients[
+                        message_spec["message"].get("region") or "eu-central-2"
+                    ],
                 )
-                _logger.error(error_msg)
-                raise ValueError(error_msg)
-            eligible_stacks.append(stack_candidate)
+                future_to_stack[future] = message_spec
 
-        stack_names_in_process = set(
-            [m["message"]["stack_name"] for m in eligible_stacks]
-        )
-        with ThreadPoolExecutor() as executor:
-            # Dictionary to hold future submissions
-            future_to_stack = {
-                executor.submit(
-                    deploy_stack, lambda_client, lambda_function_name, message_spec
-                ): message_spec
-                for message_spec in eligible_stacks
-                if not stack_name or message_spec["message"]["stack_name"] == stack_name
-            }
-
-            # Process as each future completes
-            for future in as_completed(future_to_stack):
-                message_spec = future_to_stack[future]
+            # Process the futures that completed, then schedule what became ready
+            done_futures, _ = wait(future_to_stack, return_when=FIRST_COMPLETED)
+            for future in done_futures:
+                message_spec = future_to_stack.pop(future)
                 try:
                     response = future.result()  # Get the result from the future
                     response_payload = response.get("Payload")
@@ -1436,9 +1604,15 @@ def deploy(lambda_function_name, config, config_file, stack_name=None):
                         failed_stacks.append(message_spec["message"]["stack_name"])
                     else:
                         successful_stacks.add(message_spec["message"]["stack_name"])
+                        for dependent in dependents[
+                            message_spec["message"]["stack_name"]
+                        ]:
+                            pending_dependency_count[dependent] -= 1
+                            if pending_dependency_count[dependent] == 0:
+                                ready_stacks.append(dependent)
 
                     _logger.info(
-                        f"Still in process: {stack_names_in_process - successful_stacks  - set(failed_stacks)}"
+                        f"Still in process: {set(m['message']['stack_name'] for m in future_to_stack.values())}"
                     )
 
                 except Exception as exc:
@@ -1448,7 +1622,32 @@ def deploy(lambda_function_name, config, config_file, stack_name=None):
                     )
                     failed_stacks.append(message_spec["message"]["stack_name"])
 
-        _logger.info(f"*** Generation {i} completed")
+    # Stacks downstream of a failure never became ready
+    blocked_stacks = set()
+    to_visit = deque(failed_stacks)
+    while to_visit:
+        for dependent in dependents[to_visit.popleft()]:
+            if dependent not in blocked_stacks:
+                blocked_stacks.add(dependent)
+                to_visit.append(dependent)
+
+    if blocked_stacks:
+        blocked_stack = next(
+            name for name in message_spec_by_stack if name in blocked_stacks
+        )
+        missing_dependencies = [
+            d
+            for d in nx.descendants(dependency_graph, blocked_stack)
+            if d not in successful_stacks
+        ]
+        error_msg = (
+            f"Cannot deploy {blocked_stack} because the following "
+            f"dependencies have not been successfully deployed: {missing_dependencies}. "
+            f"This indicates a deployment failure of a stack it depends on. "
+            f"Not deployed: {sorted(blocked_stacks)}"
+        )
+        _logger.error(error_msg)
+        raise ValueError(error_msg)
 
     if failed_stacks:
         _logger.error(f"Failed stacks: {failed_stacks}")
@@ -1520,11 +1719,9 @@ def validate_stack_name_filter(config, config_global_environment, stack_name_fil
         stripped_stack_names.append(stripped_name)
 
     # Check if the filter matches any stack (full or stripped name)
-    matches_any = False
-    for full_name in full_stack_names:
-        if compare_stack_names(full_name, stack_name_filter):
-            matches_any = True
-            break
+    matches_any = strip_environment_suffix(stack_name_filter) in set(
+        stripped_stack_names
+    )
 
     if not matches_any:
         _logger.error(
@@ -1553,6 +1750,16 @@ def do_dump(
 
     message_generations, dependency_graph = prepare_messages(config, config_file)
 
+    if stack_name is not None:
+        stack_name_index = build_stack_name_index(
+            message_spec["message"]["stack_name"]
+            for messages in message_generations
+            for message_spec in messages
+        )
+        matching_stack_names = set(
+            stack_name_index.get(strip_environment_suffix(stack_name), [])
+        )
+
     total_stacks = 0
     successful_stacks = 0
 
@@ -1567,8 +1774,9 @@ def do_dump(
             ]  # Already calculated in prepare_messages
 
             # Filter by specific stack name if provided
-            if stack_name is not None and not compare_stack_names(
-                current_stack_name, stack_name
+            if (
+                stack_name is not None
+                and current_stack_name not in matching_stack_names
             ):
                 continue
 
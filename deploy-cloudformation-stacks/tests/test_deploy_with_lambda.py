@@ -1,27 +1,94 @@
+import copy
+import json
 import logging
-from io import BytesIO, StringIO
-from pathlib import Path
-from unittest.mock import MagicMock, patch
+import sys
+import threading
+from io import StringIO
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
 
 import botocore.exceptions
 import pytest
 import yaml
 from deploy_with_lambda_call import (
+    CLOUDFORMATION_CLIENT_CONFIG,
+    DEFAULT_CLOUDFRONT_STACK_STABLE_STATE_TIMEOUT_SECONDS,
+    LAMBDA_CLIENT_CONFIG,
+    _compute_concurrency,
+    build_stack_name_index,
+    clear_yaml_cache,
+    compare_stack_names,
     deploy,
     do_dump,
     do_dump_graph,
     invoke_lambda_with_backoff,
+    load_config,
+    load_globals_from_file,
+    load_template_file,
+    load_yaml_file,
+    main,
+    prepare_messages,
     resolve_version_with_hash_support,
+    wait_for_stack_stable_state,
 )
 
 _logger = logging.getLogger(__name__)
 
+# Lambda response body shared by the invoke() mocks
+_PAYLOAD_BYTES = b'[{"status": "success"}]'
 
-def test_deploy(tmpdir):
+# get_account_settings() response of the lambda client mocks used by deploy()
+_ACCOUNT_SETTINGS = {"AccountLimit": {"ConcurrentExecutions": 1000}}
+
+
+class _FakePayload:
+    """Stands in for the StreamingBody of an invoke() response"""
+
+    __slots__ = ("_body",)
+
+    def __init__(self, body):
+        self._body = body
+
+    def read(self):
+        return self._body
+
+
+# Templates are written as literal YAML; dumping dicts only slows fixture setup
+_MY_BUCKET_TEMPLATE = """\
+Resources:
+  MyBucket:
+    Type: AWS::S3::Bucket
+    Properties:
+      BucketName: my-bucket
+"""
+
+_BUCKET_TEMPLATE = """\
+AWSTemplateFormatVersion: '2010-09-09'
+Parameters:
+  Environment:
+    Type: String
+Resources:
+  TestResource:
+    Type: AWS::S3::Bucket
+    Properties:
+      BucketName: {stack_name}-bucket
+"""
+
+
+def _write_bucket_template(path, stack_name):
+    path.write_text(_BUCKET_TEMPLATE.format(stack_name=stack_name))
+
+
+@pytest.fixture(autouse=True)
+def _debug_logs(caplog):
+    # Capture everything the deploy module logs, including the filtering debug logs
+    caplog.set_level(logging.DEBUG, logger="deploy_with_lambda_call")
+
+
+def test_deploy(tmp_path):
 
-    tempdir = Path(tmpdir)
     environment = "devops"
-    envdir = tempdir / environment
+    envdir = tmp_path / environment
 
     envdir.mkdir(parents=True, exist_ok=True)
 
@@ -39,62 +106,44 @@ def test_deploy(tmpdir):
         with open(stacks_file, "w") as f:
             yaml.dump(stacks, f)
 
-        stack_template = {
-            "Resources": {
-                "MyBucket": {
-                    "Type": "AWS::S3::Bucket",
-                    "Properties": {"BucketName": "my-bucket"},
-                }
-            }
-        }
-
         stack_template_file = envdir / "test_stack.yaml"
-
-        with open(stack_template_file, "w") as f:
-            yaml.dump(stack_template, f)
+        stack_template_file.write_text(_MY_BUCKET_TEMPLATE)
 
         # print the content of the directory
-        for path in tempdir.rglob("*"):
-            _logger.info(f"Path: {path}")
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug("\n".join(f"Path: {path}" for path in tmp_path.rglob("*")))
 
-        config = yaml.safe_load(open(stacks_file))
+        config = copy.deepcopy(stacks)
         do_dump_graph(config, stacks_file.as_posix())
 
 
-def test_deploy_2(tmpdir):
+def test_deploy_2(tmp_path):
 
-    tempdir = Path(tmpdir)
     environment = "devops"
-    envdir = tempdir / environment
+    envdir = tmp_path / environment
 
     envdir.mkdir(parents=True, exist_ok=True)
 
     with patch("deploy_with_lambda_call.boto3", name="boto3_mock") as boto3_mock:
-        lambda_client_mock = MagicMock()
-        boto3_mock.client.return_value = lambda_client_mock
-
-        # Set up the exception as a real Exception class
-        lambda_client_mock.exceptions = MagicMock()
 
         class TooManyRequestsException(Exception):
             def __init__(self, message):
                 super().__init__(message)
                 self.message = message
 
-        lambda_client_mock.exceptions.TooManyRequestsException = (
-            TooManyRequestsException
-        )
-
         # Mock the invoke() return value
-        payload_content = '[{"status": "success"}]'
-        payload_stream = BytesIO(payload_content.encode("utf-8"))
-        payload_mock = MagicMock()
-        payload_mock.read.return_value = payload_stream.read()
-        payload_mock.decode = lambda encoding="utf-8": payload_content
-
-        lambda_client_mock.invoke.return_value = {"Payload": payload_mock}
+        payload_mock = _FakePayload(_PAYLOAD_BYTES)
+
+        # Only invoke() and the exceptions namespace are used on the lambda client
+        lambda_client_mock = SimpleNamespace(
+            invoke=Mock(return_value={"Payload": payload_mock}),
+            exceptions=SimpleNamespace(
+                TooManyRequestsException=TooManyRequestsException
+            ),
+        )
+        boto3_mock.client.return_value = lambda_client_mock
 
-        cf_client_mock = MagicMock()
+        cf_client_mock = SimpleNamespace(describe_stacks=Mock())
 
         # Patch boto3.client to return cf_client_mock when called with "cloudformation"
         def client_side_effect(service_name, *args, **kwargs):
@@ -123,48 +172,35 @@ def test_deploy_2(tmpdir):
         with open(stacks_file, "w") as f:
             yaml.dump(stacks, f)
 
-        stack_template = {
-            "Resources": {
-                "MyBucket": {
-                    "Type": "AWS::S3::Bucket",
-                    "Properties": {"BucketName": "my-bucket"},
-                }
-            }
-        }
-
         stack_template_file = envdir / "test_stack.yaml"
-
-        with open(stack_template_file, "w") as f:
-            yaml.dump(stack_template, f)
+        stack_template_file.write_text(_MY_BUCKET_TEMPLATE)
 
         # print the content of the directory
-        for path in tempdir.rglob("*"):
-            _logger.info(f"Path: {path}")
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug("\n".join(f"Path: {path}" for path in tmp_path.rglob("*")))
 
-        config = yaml.safe_load(open(stacks_file))
+        config = copy.deepcopy(stacks)
         do_dump_graph(config, stacks_file.as_posix())
 
 
 def test_invoke_lambda_with_backoff_retries_read_timeout():
-    lambda_client_mock = MagicMock()
-    lambda_client_mock.exceptions = MagicMock()
-
     class TooManyRequestsException(Exception):
         pass
 
-    lambda_client_mock.exceptions.TooManyRequestsException = TooManyRequestsException
-
-    payload_content = '[{"status": "success"}]'
-    payload_mock = MagicMock()
-    payload_mock.read.return_value = payload_content.encode("utf-8")
-
-    lambda_client_mock.invoke.side_effect = [
-        botocore.exceptions.ReadTimeoutError(
-            endpoint_url="https://lambda.eu-central-2.amazonaws.com/test",
-            error="timed out",
+    payload_mock = _FakePayload(_PAYLOAD_BYTES)
+
+    lambda_client_mock = SimpleNamespace(
+        invoke=Mock(
+            side_effect=[
+                botocore.exceptions.ReadTimeoutError(
+                    endpoint_url="https://lambda.eu-central-2.amazonaws.com/test",
+                    error="timed out",
+                ),
+                {"Payload": payload_mock},
+            ]
         ),
-        {"Payload": payload_mock},
-    ]
+        exceptions=SimpleNamespace(TooManyRequestsException=TooManyRequestsException),
+    )
 
     with patch("deploy_with_lambda_call.time.sleep") as sleep_mock, patch(
         "deploy_with_lambda_call.random.uniform", return_value=0
@@ -183,6 +219,158 @@ def test_invoke_lambda_with_backoff_retries_read_timeout():
     sleep_mock.assert_called_once_with(1)
 
 
+def test_invoke_lambda_with_backoff_keeps_non_json_payload_as_text():
+    payload_mock = _FakePayload("Task timed out – no JSON".encode("utf-8"))
+
+    lambda_client_mock = SimpleNamespace(
+        invoke=Mock(return_value={"Payload": payload_mock}),
+        exceptions=SimpleNamespace(TooManyRequestsException=Exception),
+    )
+
+    response = invoke_lambda_with_backoff(
+        lambda_client_mock, "test-function", {"hello": "world"}
+    )
+
+    assert response["Payload"] == "Task timed out – no JSON"
+
+
+def test_invoke_lambda_with_backoff_reports_throttling():
+    class TooManyRequestsException(Exception):
+        pass
+
+    payload_mock = _FakePayload(_PAYLOAD_BYTES)
+
+    lambda_client_mock = SimpleNamespace(
+        invoke=Mock(
+            side_effect=[
+                TooManyRequestsException("Rate exceeded"),
+                {"Payload": payload_mock},
+            ]
+        ),
+        exceptions=SimpleNamespace(TooManyRequestsException=TooManyRequestsException),
+    )
+    on_throttle = Mock()
+
+    with patch("deploy_with_lambda_call.time.sleep"):
+        response = invoke_lambda_with_backoff(
+            lambda_client_mock,
+            "test-function",
+            {"hello": "world"},
+            on_throttle=on_throttle,
+        )
+
+    assert response["Payload"] == [{"status": "success"}]
+    on_throttle.assert_called_once_with()
+
+
+@pytest.mark.parametrize(
+    "concurrent_executions, expected",
+    [(1000, 32), (40, 10), (2, 1)],
+)
+def test_compute_concurrency(concurrent_executions, expected):
+    lambda_client_mock = SimpleNamespace(
+        get_account_settings=Mock(
+            return_value={
+                "AccountLimit": {"ConcurrentExecutions": concurrent_executions}
+            }
+        )
+    )
+
+    assert _compute_concurrency(lambda_client_mock) == expected
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        botocore.exceptions.EndpointConnectionError(endpoint_url="https://lambda"),
+        KeyError("AccountLimit"),
+    ],
+)
+def test_compute_concurrency_without_account_settings(error):
+    lambda_client_mock = SimpleNamespace(get_account_settings=Mock(side_effect=error))
+
+    assert _compute_concurrency(lambda_client_mock) == 32
+
+
+def test_compute_concurrency_does_not_hide_programming_errors():
+    with pytest.raises(AttributeError):
+        _compute_concurrency(SimpleNamespace())
+
+
+def test_compute_concurrency_without_permission(caplog):
+    lambda_client_mock = SimpleNamespace(
+        get_account_settings=Mock(
+            side_effect=botocore.exceptions.ClientError(
+                {"Error": {"Code": "AccessDeniedException", "Message": "denied"}},
+                "GetAccountSettings",
+            )
+        )
+    )
+
+    assert _compute_concurrency(lambda_client_mock) == 32
+    assert "Could not read Lambda account settings" in caplog.text
+    assert not [r for r in caplog.records if r.levelno >= logging.WARNING]
+
+
+def test_deploy_halves_concurrency_when_throttled(tmp_path, caplog):
+    envdir = tmp_path / "devops"
+    envdir.mkdir()
+    stack_names = [f"test-stack-{i}" for i in range(8)]
+    stacks = {
+        "environment": "devops",
+        "stacks": [{"stack_name": name} for name in stack_names],
+    }
+    stacks_file = envdir / "stacks.yaml"
+    stacks_file.write_text(yaml.dump(stacks))
+    for name in stack_names:
+        _write_bucket_template(envdir / f"{name.replace('-', '_')}.yaml", name)
+
+    class TooManyRequestsException(Exception):
+        pass
+
+    lock = threading.Lock()
+    state = {"invokes": 0, "in_flight": 0, "completed": 0}
+    in_flight_after_throttle = []
+    deployed_stacks = []
+
+    def invoke(FunctionName, InvocationType, Payload):
+        with lock:
+            state["invokes"] += 1
+            if state["invokes"] == 1:
+                raise TooManyRequestsException("Rate exceeded")
+            state["in_flight"] += 1
+            if state["completed"]:
+                in_flight_after_throttle.append(state["in_flight"])
+            message = json.loads(json.loads(Payload)["Records"][0]["body"])
+            deployed_stacks.append(message["stack_name"])
+        # Keep the invocations overlapping
+        threading.Event().wait(0.05)
+        with lock:
+            state["in_flight"] -= 1
+            state["completed"] += 1
+        return {"Payload": _FakePayload(_PAYLOAD_BYTES)}
+
+    lambda_client = SimpleNamespace(
+        invoke=invoke,
+        get_account_settings=Mock(return_value=_ACCOUNT_SETTINGS),
+        exceptions=SimpleNamespace(TooManyRequestsException=TooManyRequestsException),
+    )
+
+    with patch("deploy_with_lambda_call.boto3") as boto3_mock, patch(
+        "deploy_with_lambda_call.wait_for_stack_stable_state",
+        return_value="UPDATE_COMPLETE",
+    ), patch("deploy_with_lambda_call.time.sleep"):
+        boto3_mock.client.return_value = lambda_client
+        deploy(
+            "test-lambda", copy.deepcopy(stacks), stacks_file.as_posix(), max_workers=4
+        )
+
+    assert "deploying at most 2 stacks in parallel" in caplog.text
+    assert sorted(deployed_stacks) == sorted(f"{name}-devops" for name in stack_names)
+    assert in_flight_after_throttle
+    assert max(in_flight_after_throttle) <= 2
+
+
 def test_resolve_version_with_hash_support():
     """Test the hash-based version resolution functionality."""
 
@@ -268,14 +456,9 @@ def test_resolve_version_with_hash_support():
     assert result is None
 
 
-def test_deploy_uses_cloudfront_specific_stable_state_timeout(tmpdir):
-    from deploy_with_lambda_call import (
-        DEFAULT_CLOUDFRONT_STACK_STABLE_STATE_TIMEOUT_SECONDS,
-    )
-
-    tempdir = Path(tmpdir)
+def test_deploy_uses_cloudfront_specific_stable_state_timeout(tmp_path):
     environment = "devops"
-    envdir = tempdir / environment
+    envdir = tmp_path / environment
     envdir.mkdir(parents=True, exist_ok=True)
 
     stacks = {
@@ -298,35 +481,41 @@ def test_deploy_uses_cloudfront_specific_stable_state_timeout(tmpdir):
     with patch("deploy_with_lambda_call.boto3") as boto3_mock, patch(
         "deploy_with_lambda_call.wait_for_stack_stable_state"
     ) as mock_wait:
-        lambda_client_mock = MagicMock()
-        boto3_mock.client.return_value = lambda_client_mock
-
-        lambda_client_mock.exceptions = MagicMock()
 
         class TooManyRequestsException(Exception):
             pass
 
-        lambda_client_mock.exceptions.TooManyRequestsException = (
-            TooManyRequestsException
+        payload_mock = _FakePayload(_PAYLOAD_BYTES)
+        boto3_mock.client.return_value = SimpleNamespace(
+            invoke=Mock(return_value={"Payload": payload_mock}),
+            get_account_settings=Mock(return_value=_ACCOUNT_SETTINGS),
+            exceptions=SimpleNamespace(
+                TooManyRequestsException=TooManyRequestsException
+            ),
         )
-
-        payload_mock = MagicMock()
-        payload_mock.read.return_value = b'[{"status": "success"}]'
-        lambda_client_mock.invoke.return_value = {"Payload": payload_mock}
         mock_wait.return_value = "UPDATE_COMPLETE"
 
-        config = yaml.safe_load(open(stacks_file))
+        config = copy.deepcopy(stacks)
         deploy("test-lambda", config, stacks_file.as_posix())
 
         assert mock_wait.call_args.kwargs["timeout_seconds"] == (
             DEFAULT_CLOUDFRONT_STACK_STABLE_STATE_TIMEOUT_SECONDS
         )
+        boto3_mock.client.assert_any_call(
+            "lambda", region_name="eu-central-2", config=LAMBDA_CLIENT_CONFIG
+        )
+        boto3_mock.client.assert_any_call(
+            "cloudformation",
+            region_name="eu-central-2",
+            config=CLOUDFORMATION_CLIENT_CONFIG,
+        )
+        assert boto3_mock.client.call_count == 2
+        assert mock_wait.call_args.kwargs["cf_client"] is boto3_mock.client.return_value
 
 
-def test_deploy_uses_explicit_stable_state_timeout_override(tmpdir):
-    tempdir = Path(tmpdir)
+def test_deploy_uses_explicit_stable_state_timeout_override(tmp_path):
     environment = "devops"
-    envdir = tempdir / environment
+    envdir = tmp_path / environment
     envdir.mkdir(parents=True, exist_ok=True)
 
     stacks = {
@@ -354,33 +543,45 @@ def test_deploy_uses_explicit_stable_state_timeout_override(tmpdir):
     with patch("deploy_with_lambda_call.boto3") as boto3_mock, patch(
         "deploy_with_lambda_call.wait_for_stack_stable_state"
     ) as mock_wait:
-        lambda_client_mock = MagicMock()
-        boto3_mock.client.return_value = lambda_client_mock
-
-        lambda_client_mock.exceptions = MagicMock()
 
         class TooManyRequestsException(Exception):
             pass
 
-        lambda_client_mock.exceptions.TooManyRequestsException = (
-            TooManyRequestsException
+        payload_mock = _FakePayload(_PAYLOAD_BYTES)
+        boto3_mock.client.return_value = SimpleNamespace(
+            invoke=Mock(return_value={"Payload": payload_mock}),
+            get_account_settings=Mock(return_value=_ACCOUNT_SETTINGS),
+            exceptions=SimpleNamespace(
+                TooManyRequestsException=TooManyRequestsException
+            ),
         )
-
-        payload_mock = MagicMock()
-        payload_mock.read.return_value = b'[{"status": "success"}]'
-        lambda_client_mock.invoke.return_value = {"Payload": payload_mock}
         mock_wait.return_value = "CREATE_COMPLETE"
 
-        config = yaml.safe_load(open(stacks_file))
+        config = copy.deepcopy(stacks)
         deploy("test-lambda", config, stacks_file.as_posix())
 
         assert mock_wait.call_args.kwargs["timeout_seconds"] == 420
 
 
+def test_wait_for_stack_stable_state_uses_given_client():
+    cf_client_mock = SimpleNamespace(
+        describe_stacks=Mock(
+            return_value={"Stacks": [{"StackStatus": "UPDATE_COMPLETE"}]}
+        )
+    )
+
+    with patch("deploy_with_lambda_call.boto3") as boto3_mock:
+        state = wait_for_stack_stable_state(
+            "test-stack", "eu-central-2", cf_client=cf_client_mock
+        )
+
+    assert state == "UPDATE_COMPLETE"
+    cf_client_mock.describe_stacks.assert_called_once_with(StackName="test-stack")
+    boto3_mock.client.assert_not_called()
+
+
 def test_compare_stack_names():
     """Test the stack name comparison function."""
-    from deploy_with_lambda_call import compare_stack_names
-
     # Test exact match
     assert compare_stack_names("stack-two", "stack-two") == True
 
@@ -394,11 +595,25 @@ def test_compare_stack_names():
     assert compare_stack_names("stack-one-development", "stack-two") == False
 
 
-def test_stack_filtering_single_stack(tmpdir, caplog):
-    """Test that single stack filtering works correctly."""
-    tempdir = Path(tmpdir)
+def test_build_stack_name_index():
+    """Test indexing stack names by their name without environment suffix."""
+    index = build_stack_name_index(
+        ["stack-one-development", "stack-two-development", "stack-three"]
+    )
+
+    assert index == {
+        "stack-one": ["stack-one-development"],
+        "stack-two": ["stack-two-development"],
+        "stack-three": ["stack-three"],
+    }
+    assert "stack-four" not in index
+
+
+@pytest.fixture(scope="module")
+def stack_filtering_env(tmp_path_factory):
+    """Build a three-stack environment once for the stack filtering tests."""
     environment = "development"  # Use valid environment from ENVIRONMENT_PRIORITY
-    envdir = tempdir / environment
+    envdir = tmp_path_factory.mktemp("stack_filtering") / environment
 
     envdir.mkdir(parents=True, exist_ok=True)
 
@@ -430,330 +645,95 @@ def test_stack_filtering_single_stack(tmpdir, caplog):
 
     # Create simple template files
     for stack_name in ["stack_one", "stack_two", "stack_three"]:
-        stack_template = {
-            "AWSTemplateFormatVersion": "2010-09-09",
-            "Parameters": {"Environment": {"Type": "String"}},
-            "Resources": {
-                "TestResource": {
-                    "Type": "AWS::S3::Bucket",
-                    "Properties": {"BucketName": f"{stack_name}-bucket"},
-                }
-            },
-        }
-
-        stack_template_file = envdir / f"{stack_name}.yaml"
-        with open(stack_template_file, "w") as f:
-            yaml.dump(stack_template, f)
-
-    config = yaml.safe_load(open(stacks_file))
-
-    # Test filtering for a specific stack
-    with caplog.at_level(logging.DEBUG):  # Use DEBUG to see the filtering logs
-        do_dump(
-            config,
-            stacks_file.as_posix(),
-            environment,
-            verbose=False,
-            stack_name="stack-two",
-        )
-
-    # Check that only one stack was processed
-    summary_logs = [
-        record.message
-        for record in caplog.records
-        if "Summary: Successfully processed" in record.message
-    ]
-    assert len(summary_logs) == 1
-    assert "1/1 templates" in summary_logs[0]
-
-    # Check that the correct stack was processed
-    stack_logs = [
-        record.message
-        for record in caplog.records
-        if "✓" in record.message and "stack-two-development" in record.message
-    ]
-    assert len(stack_logs) == 1
-
-    # Ensure other stacks were NOT processed
-    other_stack_logs = [
-        record.message
-        for record in caplog.records
-        if "✓" in record.message
-        and (
-            "stack-one-development" in record.message
-            or "stack-three-development" in record.message
-        )
-    ]
-
-    # Check that only one stack was processed
-    summary_logs = [
-        record.message
-        for record in caplog.records
-        if "Summary: Successfully processed" in record.message
-    ]
-    assert len(summary_logs) == 1
-    assert "1/1 templates" in summary_logs[0]
-
-    # Check that the correct stack was processed
-    stack_logs = [
-        record.message
-        for record in caplog.records
-        if "✓" in record.message and "stack-two-development" in record.message
-    ]
-    assert len(stack_logs) == 1
-
-    # Ensure other stacks were NOT processed
-    other_stack_logs = [
-        record.message
-        for record in caplog.records
-        if "✓" in record.message
-        and (
-            "stack-one-development" in record.message
-            or "stack-three-development" in record.message
-        )
-    ]
-    assert len(other_stack_logs) == 0
-
-
-def test_stack_filtering_all_stacks(tmpdir, caplog):
-    """Test that without stack filtering, all stacks are processed."""
-    tempdir = Path(tmpdir)
-    environment = "development"  # Use valid environment from ENVIRONMENT_PRIORITY
-    envdir = tempdir / environment
-
-    envdir.mkdir(parents=True, exist_ok=True)
-
-    # Create a simple stacks configuration with multiple stacks
-    stacks = {
-        "environment": environment,
-        "globals": {"SomeGlobal": "test-value"},
-        "stacks": [
-            {
-                "stack_name": "stack-alpha",
-                "template_file": "stack_alpha.yaml",
-                "parameters": {"Environment": {"$ref": "Environment"}},
-            },
-            {
-                "stack_name": "stack-beta",
-                "template_file": "stack_beta.yaml",
-                "parameters": {"Environment": {"$ref": "Environment"}},
-            },
-        ],
-    }
-    stacks_file = envdir / "stacks.yaml"
-    with open(stacks_file, "w") as f:
-        yaml.dump(stacks, f)
-
-    # Create simple template files
-    for stack_name in ["stack_alpha", "stack_beta"]:
-        stack_template = {
-            "AWSTemplateFormatVersion": "2010-09-09",
-            "Parameters": {"Environment": {"Type": "String"}},
-            "Resources": {
-                "TestResource": {
-                    "Type": "AWS::S3::Bucket",
-                    "Properties": {"BucketName": f"{stack_name}-bucket"},
-                }
-            },
-        }
-
-        stack_template_file = envdir / f"{stack_name}.yaml"
-        with open(stack_template_file, "w") as f:
-            yaml.dump(stack_template, f)
-
-    config = yaml.safe_load(open(stacks_file))
-
-    # Test without filtering (should process all stacks)
-    with caplog.at_level(logging.INFO):
-        do_dump(
-            config, stacks_file.as_posix(), environment, verbose=False, stack_name=None
-        )
+        _write_bucket_template(envdir / f"{stack_name}.yaml", stack_name)
+
+    return stacks, stacks_file.as_posix(), environment
+
+
+@pytest.mark.parametrize(
+    "stack_name, expected_stacks",
+    [
+        # Base stack name (without environment suffix)
+        ("stack-two", ["stack-two-development"]),
+        # Full stack name (with environment suffix)
+        ("stack-three-development", ["stack-three-development"]),
+        # No filter processes all stacks
+        (
+            None,
+            [
+                "stack-one-development",
+                "stack-two-development",
+                "stack-three-development",
+            ],
+        ),
+    ],
+)
+def test_stack_filtering(stack_filtering_env, caplog, stack_name, expected_stacks):
+    """Test that stack filtering processes exactly the matching stacks."""
+    stacks, stacks_path, environment = stack_filtering_env
+
+    # Fresh config for each case, prepare_messages works on it in place
+    config = copy.deepcopy(stacks)
+
+    do_dump(
+        config,
+        stacks_path,
+        environment,
+        verbose=False,
+        stack_name=stack_name,
+    )
 
-    # Check that both stacks were processed
+    # Check that exactly the expected number of stacks was processed
     summary_logs = [
         record.message
         for record in caplog.records
         if "Summary: Successfully processed" in record.message
     ]
     assert len(summary_logs) == 1
-    assert "2/2 templates" in summary_logs[0]
+    expected_count = len(expected_stacks)
+    assert f"{expected_count}/{expected_count} templates" in summary_logs[0]
 
-    # Check that both stacks were processed
-    alpha_logs = [
-        record.message
-        for record in caplog.records
-        if "✓" in record.message and "stack-alpha-development" in record.message
-    ]
-    beta_logs = [
-        record.message
+    # Check that the correct stacks were processed, and no others
+    processed_stacks = [
+        record.message.split()[1]
         for record in caplog.records
-        if "✓" in record.message and "stack-beta-development" in record.message
+        if record.message.startswith("✓")
     ]
-    assert len(alpha_logs) == 1
-    assert len(beta_logs) == 1
+    assert sorted(processed_stacks) == sorted(expected_stacks)
 
 
-def test_stack_filtering_nonexistent_stack(tmpdir, caplog):
+def test_stack_filtering_nonexistent_stack(stack_filtering_env, caplog):
     """Test that filtering for a nonexistent stack shows helpful error message."""
-    import pytest
-
-    tempdir = Path(tmpdir)
-    environment = "development"  # Use valid environment from ENVIRONMENT_PRIORITY
-    envdir = tempdir / environment
-
-    envdir.mkdir(parents=True, exist_ok=True)
-
-    # Create a simple stacks configuration
-    stacks = {
-        "environment": environment,
-        "globals": {},
-        "stacks": [
-            {
-                "stack_name": "real-stack",
-                "template_file": "real_stack.yaml",
-                "parameters": {"Environment": {"$ref": "Environment"}},
-            }
-        ],
-    }
-    stacks_file = envdir / "stacks.yaml"
-    with open(stacks_file, "w") as f:
-        yaml.dump(stacks, f)
-
-    # Create template file
-    stack_template = {
-        "AWSTemplateFormatVersion": "2010-09-09",
-        "Parameters": {"Environment": {"Type": "String"}},
-        "Resources": {
-            "TestResource": {
-                "Type": "AWS::S3::Bucket",
-                "Properties": {"BucketName": "real-stack-bucket"},
-            }
-        },
-    }
+    stacks, stacks_path, environment = stack_filtering_env
 
-    stack_template_file = envdir / "real_stack.yaml"
-    with open(stack_template_file, "w") as f:
-        yaml.dump(stack_template, f)
-
-    config = yaml.safe_load(open(stacks_file))
+    config = copy.deepcopy(stacks)
 
     # Test filtering for a nonexistent stack should raise SystemExit
-    with caplog.at_level(logging.ERROR):
-        with pytest.raises(SystemExit) as exc_info:
-            do_dump(
-                config,
-                stacks_file.as_posix(),
-                environment,
-                verbose=False,
-                stack_name="nonexistent-stack",
-            )
-
-    # Check that it exits with code 1
-    assert exc_info.value.code == 1
-
-    # Check that helpful error messages were logged
-    error_logs = [
-        record.message for record in caplog.records if record.levelname == "ERROR"
-    ]
-    assert any("does not match any available stacks" in msg for msg in error_logs)
-    assert any("real-stack" in msg for msg in error_logs)
-    assert any("real-stack-development" in msg for msg in error_logs)
-
-
-def test_stack_filtering_both_name_formats(tmpdir, caplog):
-    """Test that both full stack names and base names work for filtering."""
-    tempdir = Path(tmpdir)
-    environment = "development"
-    envdir = tempdir / environment
-
-    envdir.mkdir(parents=True, exist_ok=True)
-
-    # Create a simple stacks configuration
-    stacks = {
-        "environment": environment,
-        "globals": {},
-        "stacks": [
-            {
-                "stack_name": "test-stack-alpha",
-                "template_file": "test_stack_alpha.yaml",
-                "parameters": {"Environment": {"$ref": "Environment"}},
-            },
-            {
-                "stack_name": "test-stack-beta",
-                "template_file": "test_stack_beta.yaml",
-                "parameters": {"Environment": {"$ref": "Environment"}},
-            },
-        ],
-    }
-    stacks_file = envdir / "stacks.yaml"
-    with open(stacks_file, "w") as f:
-        yaml.dump(stacks, f)
-
-    # Create template files
-    for stack_name in ["test_stack_alpha", "test_stack_beta"]:
-        stack_template = {
-            "AWSTemplateFormatVersion": "2010-09-09",
-            "Parameters": {"Environment": {"Type": "String"}},
-            "Resources": {
-                "TestResource": {
-                    "Type": "AWS::S3::Bucket",
-                    "Properties": {"BucketName": f"{stack_name}-bucket"},
-                }
-            },
-        }
-
-        stack_template_file = envdir / f"{stack_name}.yaml"
-        with open(stack_template_file, "w") as f:
-            yaml.dump(stack_template, f)
-
-    config = yaml.safe_load(open(stacks_file))
-
-    # Test 1: Filter using base stack name (without environment suffix)
-    caplog.clear()
-    config1 = yaml.safe_load(open(stacks_file))  # Fresh config for each test
-    with caplog.at_level(logging.INFO):
+    with pytest.raises(SystemExit) as exc_info:
         do_dump(
-            config1,
-            stacks_file.as_posix(),
+            config,
+            stacks_path,
             environment,
             verbose=False,
-            stack_name="test-stack-alpha",
+            stack_name="nonexistent-stack",
         )
 
-    summary_logs = [
-        record.message
-        for record in caplog.records
-        if "Summary: Successfully processed" in record.message
-    ]
-    assert len(summary_logs) == 1
-    assert "1/1 templates" in summary_logs[0]
-
-    # Test 2: Filter using full stack name (with environment suffix)
-    caplog.clear()
-    config2 = yaml.safe_load(open(stacks_file))  # Fresh config for each test
-    with caplog.at_level(logging.INFO):
-        do_dump(
-            config2,
-            stacks_file.as_posix(),
-            environment,
-            verbose=False,
-            stack_name="test-stack-beta-development",
-        )
+    # Check that it exits with code 1
+    assert exc_info.value.code == 1
 
-    summary_logs = [
-        record.message
-        for record in caplog.records
-        if "Summary: Successfully processed" in record.message
-    ]
-    assert len(summary_logs) == 1
-    assert "1/1 templates" in summary_logs[0]
+    # Check that helpful error messages were logged
+    error_logs = "\n".join(
+        record.message for record in caplog.records if record.levelname == "ERROR"
+    )
+    assert "does not match any available stacks" in error_logs
+    assert "stack-one" in error_logs
+    assert "stack-one-development" in error_logs
 
 
-def test_override_globals_file_functionality(tmpdir, caplog):
+def test_override_globals_file_functionality(tmp_path, caplog):
     """Test the --override-globals-file functionality."""
-    tempdir = Path(tmpdir)
     environment = "development"
-    envdir = tempdir / environment
+    envdir = tmp_path / environment
 
     envdir.mkdir(parents=True, exist_ok=True)
 
@@ -780,7 +760,7 @@ def test_override_globals_file_functionality(tmpdir, caplog):
         yaml.dump(stacks, f)
 
     # Create a globals override file
-    override_globals_file = tempdir / "override_globals.txt"
+    override_globals_file = tmp_path / "override_globals.txt"
     with open(override_globals_file, "w") as f:
         f.write("TestVersion=overridden-version-456\n")
         f.write("AnotherVar=additional-value\n")
@@ -804,10 +784,9 @@ def test_override_globals_file_functionality(tmpdir, caplog):
     with open(stack_template_file, "w") as f:
         yaml.dump(stack_template, f)
 
-    config = yaml.safe_load(open(stacks_file))
+    config = copy.deepcopy(stacks)
 
     # Test with override globals file
-    from deploy_with_lambda_call import prepare_messages
 
     # Mock the override globals file loading by patching the load function
     with patch("deploy_with_lambda_call.load_globals_from_file") as mock_load:
@@ -816,11 +795,10 @@ def test_override_globals_file_functionality(tmpdir, caplog):
             "AnotherVar": "additional-value",
         }
 
-        with caplog.at_level(logging.DEBUG):
-            # This should use the overridden values
-            message_generations, dependency_graph = prepare_messages(
-                config, stacks_file.as_posix()
-            )
+        # This should use the overridden values
+        message_generations, dependency_graph = prepare_messages(
+            config, stacks_file.as_posix()
+        )
 
         # Verify that load_globals_from_file was called
         mock_load.assert_called()
@@ -835,14 +813,11 @@ def test_override_globals_file_functionality(tmpdir, caplog):
         )
 
 
-def test_load_globals_from_file_functionality(tmpdir):
+def test_load_globals_from_file_functionality(tmp_path):
     """Test the load_globals_from_file function directly."""
-    from deploy_with_lambda_call import load_globals_from_file
-
-    tempdir = Path(tmpdir)
 
     # Create a globals file with different formats
-    globals_file = tempdir / "test_globals.txt"
+    globals_file = tmp_path / "test_globals.txt"
     with open(globals_file, "w") as f:
         f.write("# This is a comment\n")
         f.write("simple_var=simple_value\n")
@@ -868,13 +843,40 @@ def test_load_globals_from_file_functionality(tmpdir):
     assert result == {}
 
 
-def test_override_globals_file_functionality(tmpdir, caplog):
-    """Test that --override-globals-file parameter works correctly."""
-    from deploy_with_lambda_call import load_config, prepare_messages
+def test_load_yaml_file(tmp_path):
+    yaml_file = tmp_path / "stacks.yaml"
+    yaml_file.write_text("stacks:\n  - stack_name: stack-one\n")
+
+    assert load_yaml_file(yaml_file) == {"stacks": [{"stack_name": "stack-one"}]}
 
-    tempdir = Path(tmpdir)
+
+def test_load_template_file(tmp_path):
+    """Test that a template is read once and returned as text and parsed content."""
+    clear_yaml_cache()
+
+    template_file = tmp_path / "stack_one.yaml"
+    _write_bucket_template(template_file, "stack_one")
+
+    template_body, template_content = load_template_file(template_file)
+    assert template_body == template_file.read_text()
+    assert template_content["Resources"]["TestResource"]["Properties"] == {
+        "BucketName": "stack_one-bucket"
+    }
+
+    # Stacks sharing the template get the same parse result
+    with patch("builtins.open") as open_mock:
+        assert load_template_file(template_file)[1] is template_content
+    open_mock.assert_not_called()
+
+    # A changed file is read again
+    _write_bucket_template(template_file, "stack_one_changed")
+    assert load_template_file(template_file)[0] == template_file.read_text()
+
+
+def test_override_globals_file_functionality(tmp_path, caplog):
+    """Test that --override-globals-file parameter works correctly."""
     environment = "development"
-    envdir = tempdir / environment
+    envdir = tmp_path / environment
 
     envdir.mkdir(parents=True, exist_ok=True)
 
@@ -924,24 +926,26 @@ def test_override_globals_file_functionality(tmpdir, caplog):
         yaml.dump(stack_template, f)
 
     # Create a versions file (like .poemai-upstream-versions.yaml)
-    versions_file = tempdir / "versions.yaml"
+    versions_file = tmp_path / "versions.yaml"
     versions_data = {"versions": {"poemAI-ch/test-repo#test_lambda": "abcdef123456"}}
     with open(versions_file, "w") as f:
         yaml.dump(versions_data, f)
 
     # Create an override globals file (like devops_lambda_versions.txt)
-    override_globals_file = tempdir / "override_globals.txt"
+    override_globals_file = tmp_path / "override_globals.txt"
     with open(override_globals_file, "w") as f:
         f.write("TestLambdaVersion=override123456\n")
         f.write("AnotherVersion=overridden-value\n")
 
+    stacks_path = stacks_file.as_posix()
+
     # Test 1: Load config without override file (should use version from versions.yaml)
-    config = load_config(str(stacks_file))
+    config = load_config(stacks_path)
     config["repo_versions_file"] = (
         "../versions.yaml"  # Relative to the stacks.yaml file
     )
 
-    message_generations, dependency_graph = prepare_messages(config, str(stacks_file))
+    message_generations, dependency_graph = prepare_messages(config, stacks_path)
     messages = [msg for generation in message_generations for msg in generation]
 
     # Should use version from versions.yaml
@@ -957,16 +961,11 @@ def test_override_globals_file_functionality(tmpdir, caplog):
     assert test_message["message"]["parameters"]["AnotherParam"] == "default-version"
 
     # Test 2: Test with override globals file using the correct parameter name
-    import argparse
-    import sys
-    from io import StringIO
-    from unittest.mock import patch
-
     # Mock sys.argv to include the override globals file parameter
     test_args = [
         "deploy_with_lambda_call.py",
         "dump",
-        str(stacks_file),
+        stacks_path,
         "--override-globals-file",
         str(override_globals_file),
     ]
@@ -977,14 +976,11 @@ def test_override_globals_file_functionality(tmpdir, caplog):
     with patch.object(sys, "argv", test_args), patch.object(
         sys, "stdout", captured_output
     ):
-        from deploy_with_lambda_call import main
-
         # Capture the output to verify override worked
-        with caplog.at_level(logging.INFO):
-            try:
-                main()
-            except SystemExit:
-                pass  # main() calls sys.exit(), which is normal
+        try:
+            main()
+        except SystemExit:
+            pass  # main() calls sys.exit(), which is normal
 
     # Check captured output for override messages
     output = captured_output.getvalue()
@@ -994,20 +990,33 @@ def test_override_globals_file_functionality(tmpdir, caplog):
     assert "Using override global AnotherVersion: overridden-value" in output
 
 
-def test_deploy_fails_with_missing_dependencies(tmpdir):
+def test_deploy_fails_with_missing_dependencies(tmp_path):
     """Test that deployment fails hard when dependencies are missing."""
-    import sys
-    import time
-
-    tempdir = Path(tmpdir)
     environment = "development"
-    envdir = tempdir / environment
+    envdir = tmp_path / environment
 
     envdir.mkdir(parents=True, exist_ok=True)
 
     with patch("deploy_with_lambda_call.boto3") as boto3_mock:
-        lambda_client_mock = MagicMock()
-        cf_client_mock = MagicMock()
+
+        class TooManyRequestsException(Exception):
+            pass
+
+        # Set up lambda client mock; invoke() is replaced by a side effect below
+        lambda_client_mock = SimpleNamespace(
+            invoke=Mock(),
+            get_account_settings=Mock(return_value=_ACCOUNT_SETTINGS),
+            exceptions=SimpleNamespace(
+                TooManyRequestsException=TooManyRequestsException
+            ),
+        )
+
+        # Mock CloudFormation to report success for deployed stacks
+        cf_client_mock = SimpleNamespace(
+            describe_stacks=Mock(
+                return_value={"Stacks": [{"StackStatus": "CREATE_COMPLETE"}]}
+            )
+        )
 
         # Mock boto3 client creation
         def client_side_effect(service_name, *args, **kwargs):
@@ -1015,34 +1024,12 @@ def test_deploy_fails_with_missing_dependencies(tmpdir):
                 return lambda_client_mock
             elif service_name == "cloudformation":
                 return cf_client_mock
-            return MagicMock()
+            return Mock()
 
         boto3_mock.client.side_effect = client_side_effect
 
-        # Set up lambda client mock
-        lambda_client_mock.exceptions = MagicMock()
-
-        class TooManyRequestsException(Exception):
-            pass
-
-        lambda_client_mock.exceptions.TooManyRequestsException = (
-            TooManyRequestsException
-        )
-
-        # Mock successful lambda response for stack-a
-        payload_content = '[{"status": "success"}]'
-        payload_stream = BytesIO(payload_content.encode("utf-8"))
-        payload_mock = MagicMock()
-        payload_mock.read.return_value = payload_stream.read()
-        lambda_client_mock.invoke.return_value = {"Payload": payload_mock}
-
-        # Mock CloudFormation to report success for deployed stacks
-        cf_client_mock.describe_stacks.return_value = {
-            "Stacks": [{"StackStatus": "CREATE_COMPLETE"}]
-        }
-
         # Create stacks configuration with dependencies
-        # stack-b depends on stack-a, stack-c depends on stack-b
+        # stack-b depends on stack-a, stack-c depends on stack-b, stack-d is independent
         stacks = {
             "environment": environment,
             "globals": {},
@@ -1064,6 +1051,11 @@ def test_deploy_fails_with_missing_dependencies(tmpdir):
                     "parameters": {"Environment": {"$ref": "Environment"}},
                     "dependencies": ["stack-b"],
                 },
+                {
+                    "stack_name": "stack-d",
+                    "template_file": "stack_d.yaml",
+                    "parameters": {"Environment": {"$ref": "Environment"}},
+                },
             ],
         }
         stacks_file = envdir / "stacks.yaml"
@@ -1071,21 +1063,8 @@ def test_deploy_fails_with_missing_dependencies(tmpdir):
             yaml.dump(stacks, f)
 
         # Create template files for all stacks
-        for stack_name in ["stack_a", "stack_b", "stack_c"]:
-            stack_template = {
-                "AWSTemplateFormatVersion": "2010-09-09",
-                "Parameters": {"Environment": {"Type": "String"}},
-                "Resources": {
-                    "TestResource": {
-                        "Type": "AWS::S3::Bucket",
-                        "Properties": {"BucketName": f"{stack_name}-bucket"},
-                    }
-                },
-            }
-
-            stack_template_file = envdir / f"{stack_name}.yaml"
-            with open(stack_template_file, "w") as f:
-                yaml.dump(stack_template, f)
+        for stack_name in ["stack_a", "stack_b", "stack_c", "stack_d"]:
+            _write_bucket_template(envdir / f"{stack_name}.yaml", stack_name)
 
         # Mock a scenario where stack-a fails to deploy by making lambda throw an exception for stack-a
         def mock_invoke_side_effect(*args, **kwargs):
@@ -1095,15 +1074,11 @@ def test_deploy_fails_with_missing_dependencies(tmpdir):
                 raise Exception("Simulated deployment failure for stack-a")
             else:
                 # For other stacks, return success
-                payload_content = '[{"status": "success"}]'
-                payload_stream = BytesIO(payload_content.encode("utf-8"))
-                payload_mock = MagicMock()
-                payload_mock.read.return_value = payload_stream.read()
-                return {"Payload": payload_mock}
+                return {"Payload": _FakePayload(_PAYLOAD_BYTES)}
 
         lambda_client_mock.invoke.side_effect = mock_invoke_side_effect
 
-        config = yaml.safe_load(open(stacks_file))
+        config = copy.deepcopy(stacks)
 
         # Test that deployment fails when stack-a fails and stack-b/c can't proceed
         with pytest.raises(ValueError) as exc_info:
@@ -1121,12 +1096,19 @@ def test_deploy_fails_with_missing_dependencies(tmpdir):
         # Should specifically mention the missing dependency
         assert "stack-a-development" in error_message
 
+        # The independent stack is still deployed, the blocked ones are never invoked
+        invoked_payloads = "\n".join(
+            call.kwargs["Payload"] for call in lambda_client_mock.invoke.call_args_list
+        )
+        assert "stack-d-development" in invoked_payloads
+        assert "stack-b-development" not in invoked_payloads
+        assert "stack-c-development" not in invoked_payloads
+
 
-def test_empty_template_file_handling(tmpdir):
+def test_empty_template_file_handling(tmp_path):
     """Test that empty or invalid template files are handled gracefully."""
-    tempdir = Path(tmpdir)
     environment = "development"
-    envdir = tempdir / environment
+    envdir = tmp_path / environment
 
     envdir.mkdir(parents=True, exist_ok=True)
 
@@ -1174,10 +1156,9 @@ def test_empty_template_file_handling(tmpdir):
         f.write("\t\n")  # Tab and newline
         f.write("\n")  # Just newline
 
-    config = yaml.safe_load(open(stacks_file))
+    config = copy.deepcopy(stacks)
 
     # Test that preparing messages with empty template fails gracefully
-    from deploy_with_lambda_call import prepare_messages
 
     # Should raise a clear error message about the empty template
     with pytest.raises(ValueError) as exc_info:
@@ -1194,11 +1175,10 @@ def test_empty_template_file_handling(tmpdir):
     )
 
 
-def test_dependency_on_disabled_stack_fails(tmpdir):
+def test_dependency_on_disabled_stack_fails(tmp_path):
     """Test that depending on a disabled stack causes a validation error."""
-    tempdir = Path(tmpdir)
     environment = "development"
-    envdir = tempdir / environment
+    envdir = tmp_path / environment
 
     envdir.mkdir(parents=True, exist_ok=True)
 
@@ -1227,25 +1207,11 @@ def test_dependency_on_disabled_stack_fails(tmpdir):
 
     # Create template files (even though stack-a won't be processed due to being disabled)
     for stack_name in ["stack_a", "stack_b"]:
-        stack_template = {
-            "AWSTemplateFormatVersion": "2010-09-09",
-            "Parameters": {"Environment": {"Type": "String"}},
-            "Resources": {
-                "TestResource": {
-                    "Type": "AWS::S3::Bucket",
-                    "Properties": {"BucketName": f"{stack_name}-bucket"},
-                }
-            },
-        }
-
-        stack_template_file = envdir / f"{stack_name}.yaml"
-        with open(stack_template_file, "w") as f:
-            yaml.dump(stack_template, f)
+        _write_bucket_template(envdir / f"{stack_name}.yaml", stack_name)
 
-    config = yaml.safe_load(open(stacks_file))
+    config = copy.deepcopy(stacks)
 
     # Test that preparing messages with dependency on disabled stack fails
-    from deploy_with_lambda_call import prepare_messages
 
     # Should raise a clear error message about depending on disabled stack
     with pytest.raises(ValueError) as exc_info:
@@ -1257,11 +1223,10 @@ def test_dependency_on_disabled_stack_fails(tmpdir):
     assert "stack-a" in error_message or "stack-a-development" in error_message
 
 
-def test_disabled_stack_chain_is_allowed(tmpdir):
+def test_disabled_stack_chain_is_allowed(tmp_path):
     """Test that a disabled stack can depend on another disabled stack without error."""
-    tempdir = Path(tmpdir)
     environment = "development"
-    envdir = tempdir / environment
+    envdir = tmp_path / environment
 
     envdir.mkdir(parents=True, exist_ok=True)
 
@@ -1304,26 +1269,12 @@ def test_disabled_stack_chain_is_allowed(tmpdir):
 
     # Create template files
     for stack_name in ["stack_a", "stack_b", "stack_c"]:
-        stack_template = {
-            "AWSTemplateFormatVersion": "2010-09-09",
-            "Parameters": {"Environment": {"Type": "String"}},
-            "Resources": {
-                "TestResource": {
-                    "Type": "AWS::S3::Bucket",
-                    "Properties": {"BucketName": f"{stack_name}-bucket"},
-                }
-            },
-        }
+        _write_bucket_template(envdir / f"{stack_name}.yaml", stack_name)
 
-        stack_template_file = envdir / f"{stack_name}.yaml"
-        with open(stack_template_file, "w") as f:
-            yaml.dump(stack_template, f)
-
-    config = yaml.safe_load(open(stacks_file))
+    config = copy.deepcopy(stacks)
 
     # Test that preparing messages fails only because enabled stack-c depends on disabled stack-b
     # stack-b depending on disabled stack-a should be allowed since stack-b is also disabled
-    from deploy_with_lambda_call import prepare_messages
 
     with pytest.raises(ValueError) as exc_info:
         prepare_messages(config, stacks_file.as_posix())
@@ -1336,11 +1287,10 @@ def test_disabled_stack_chain_is_allowed(tmpdir):
     assert "stack-a-development" not in error_message
 
 
-def test_fully_disabled_chain_is_allowed(tmpdir):
+def test_fully_disabled_chain_is_allowed(tmp_path):
     """Test that a fully disabled dependency chain works without errors."""
-    tempdir = Path(tmpdir)
     environment = "development"
-    envdir = tempdir / environment
+    envdir = tmp_path / environment
 
     envdir.mkdir(parents=True, exist_ok=True)
 
@@ -1377,25 +1327,11 @@ def test_fully_disabled_chain_is_allowed(tmpdir):
 
     # Create template files
     for stack_name in ["stack_a", "stack_b", "stack_c"]:
-        stack_template = {
-            "AWSTemplateFormatVersion": "2010-09-09",
-            "Parameters": {"Environment": {"Type": "String"}},
-            "Resources": {
-                "TestResource": {
-                    "Type": "AWS::S3::Bucket",
-                    "Properties": {"BucketName": f"{stack_name}-bucket"},
-                }
-            },
-        }
-
-        stack_template_file = envdir / f"{stack_name}.yaml"
-        with open(stack_template_file, "w") as f:
-            yaml.dump(stack_template, f)
+        _write_bucket_template(envdir / f"{stack_name}.yaml", stack_name)
 
-    config = yaml.safe_load(open(stacks_file))
+    config = copy.deepcopy(stacks)
 
     # Test that preparing messages works fine when all stacks in chain are disabled
-    from deploy_with_lambda_call import prepare_messages
 
     # Should NOT raise any error since all stacks are disabled
     try:
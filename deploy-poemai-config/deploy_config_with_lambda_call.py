@@ -2,17 +2,111 @@ import argparse
 import copy
 import json
 import logging
+import math
+import os
 import sys
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
 from pathlib import Path
 
 import boto3
 import yaml
 
+try:
+    from yaml import CSafeLoader as YAML_LOADER
+except ImportError:
+    from yaml import SafeLoader as YAML_LOADER
+
+try:
+    import orjson
+
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 _logger = logging.getLogger(__name__)
 
+# Objects per lambda invocation, 0 deploys everything in one atomic invocation.
+# Shards are applied independently, a failing shard leaves the others deployed.
+DEFAULT_SHARD_SIZE = 0
+# Stays below botocore's default connection pool size of 10
+MAX_PARALLEL_SHARD_INVOCATIONS = 8
+# Threads reading yaml files, overlaps file system access of the config tree
+MAX_PARALLEL_YAML_LOADS = 8
+
+
+# Dates and times are passed through to the json module fallback, so they fail
+# the same way whether orjson is installed or not
+_ORJSON_OPTIONS = (
+    orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME if ORJSON_AVAILABLE else 0
+)
+
+
+def _non_finite_to_none(value):
+    return value if math.isfinite(value) else None
+
+
+def _json_compatible(obj):
+    """
+    Copy of obj with NaN and infinity replaced by None, the json module would
+    write them as invalid JSON while orjson writes null
+    """
+    return _replace_values_in_place(
+        copy.deepcopy(obj), _FLOAT_TYPES, _non_finite_to_none
+    )
+
+
+def json_dumps_payload(obj):
+    """
+    Serialize obj to UTF-8 JSON bytes for a lambda invocation payload
+    """
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.dumps(obj, option=_ORJSON_OPTIONS)
+        except TypeError:
+            pass  # e.g. integers beyond 64 bit, let the json module handle it
+    return json.dumps(_json_compatible(obj)).encode("utf-8")
+
+
+def json_dumps_pretty(obj):
+    """
+    Serialize obj to indented, non-ASCII-escaped JSON text for logging
+    """
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.dumps(
+                obj, option=_ORJSON_OPTIONS | orjson.OPT_INDENT_2
+            ).decode("utf-8")
+        except TypeError:
+            pass
+    return json.dumps(_json_compatible(obj), indent=2, ensure_ascii=False)
+
+
+class LazyPrettyJson:
+    """
+    Defers json_dumps_pretty until a log record is actually formatted,
+    use as a %s logging argument
+    """
+
+    __slots__ = ("obj",)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __str__(self):
+        return json_dumps_pretty(self.obj)
+
+
+def json_loads(data):
+    """
+    Parse JSON from bytes or str
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
 
 # Object type recognition (adapted from poemai-config)
 obj_type_recognition_map = {
@@ -32,42 +126,83 @@ def calc_obj_type(obj):
     """Calculate object type from pk/sk keys"""
     pk = obj.get("pk", "")
     sk = obj.get("sk", "")
-    return obj_type_recognition_map.get((pk.split("#")[0], sk.split("#")[0]), None)
+    return obj_type_recognition_map.get((pk.partition("#")[0], sk.partition("#")[0]))
+
+
+_CONTAINER_TYPES = frozenset((dict, list))
+_FLOAT_TYPES = frozenset((float,))
+_DECIMAL_TYPES = frozenset((Decimal,))
+_NUMBER_TYPES = _FLOAT_TYPES | _DECIMAL_TYPES
+
+
+def _replace_values_in_place(obj, value_types, convert):
+    """
+    Replace all values whose type is in value_types in nested dicts and lists
+    with convert(value), walking the containers with a stack instead of
+    recursion and updating them in place
+
+    Types are matched exactly with type() set lookups instead of isinstance
+    calls, parsed yaml and json only contain the builtin types.
+    """
+    if type(obj) in value_types:
+        return convert(obj)
+    if type(obj) not in _CONTAINER_TYPES:
+        return obj
+
+    stack = [obj]
+    while stack:
+        container = stack.pop()
+        items = container.items() if type(container) is dict else enumerate(container)
+        for key, value in items:
+            value_type = type(value)
+            if value_type in value_types:
+                container[key] = convert(value)
+            elif value_type in _CONTAINER_TYPES:
+                stack.append(value)
+    return obj
+
+
+def _to_decimal_string(value):
+    return str(Decimal(str(value)))
 
 
 def replace_floats_with_decimal(obj):
     """Convert floats to Decimal for DynamoDB compatibility"""
-    if isinstance(obj, dict):
-        return {key: replace_floats_with_decimal(value) for key, value in obj.items()}
-    elif isinstance(obj, list):
-        return [replace_floats_with_decimal(item) for item in obj]
-    elif isinstance(obj, float):
-        return Decimal(str(obj))
-    else:
-        return obj
+    return replace_floats_with_decimal_inplace(copy.deepcopy(obj))
+
+
+def replace_floats_with_decimal_inplace(obj):
+    """Convert floats to Decimal for DynamoDB compatibility, modifying obj"""
+    return _replace_values_in_place(
+        obj, _FLOAT_TYPES, lambda value: Decimal(str(value))
+    )
 
 
 def replace_decimal_with_string(obj):
     """Convert Decimal back to string for JSON serialization"""
-    if isinstance(obj, dict):
-        return {key: replace_decimal_with_string(value) for key, value in obj.items()}
-    elif isinstance(obj, list):
-        return [replace_decimal_with_string(item) for item in obj]
-    elif isinstance(obj, Decimal):
-        return str(obj)
-    else:
-        return obj
+    return replace_decimal_with_string_inplace(copy.deepcopy(obj))
 
 
-def transform_for_temporary_corpus_key(objects_to_load, new_corpus_key, ttl_seconds):
-    """Transform objects for temporary corpus key deployment with TTL"""
+def replace_decimal_with_string_inplace(obj):
+    """Convert Decimal back to string for JSON serialization, modifying obj"""
+    return _replace_values_in_place(obj, _DECIMAL_TYPES, str)
+
+
+def transform_for_temporary_corpus_key(
+    objects_to_load, new_corpus_key, ttl_seconds, inplace=False
+):
+    """
+    Transform objects for temporary corpus key deployment with TTL
+
+    The objects are deep copied first unless inplace is set, in which case
+    the given objects are modified and returned in the new list.
+    """
     _logger.info(
         f"Transforming {len(objects_to_load)} objects for temporary corpus key: {new_corpus_key}"
     )
 
     # Collect all existing IDs and create mapping
     key_mapping = {}
-    objects_by_id = {}
 
     # First pass: collect all object IDs
     for obj in objects_to_load:
@@ -77,14 +212,13 @@ def transform_for_temporary_corpus_key(objects_to_load, new_corpus_key, ttl_seco
             old_id = obj.get(id_name)
             if old_id:
                 key_mapping[old_id] = uuid.uuid4().hex
-                objects_by_id[old_id] = obj
                 _logger.debug(f"Mapped {obj_type} ID {old_id} -> {key_mapping[old_id]}")
 
     # Second pass: transform all objects
     transformed_objects = []
     for obj in objects_to_load:
         obj_type = calc_obj_type(obj)
-        transformed_obj = copy.deepcopy(obj)
+        transformed_obj = obj if inplace else copy.deepcopy(obj)
 
         # Set new corpus key and TTL for all objects
         transformed_obj["corpus_key"] = new_corpus_key
@@ -123,9 +257,11 @@ def transform_for_temporary_corpus_key(objects_to_load, new_corpus_key, ttl_seco
                 transformed_obj[id_name] = new_id
                 _logger.debug(f"Updated {obj_type} {id_name} from {old_id} to {new_id}")
 
-        # Convert floats to Decimal and back to string for JSON compatibility
-        transformed_obj = replace_floats_with_decimal(transformed_obj)
-        transformed_obj = replace_decimal_with_string(transformed_obj)
+        # Convert floats to Decimal and back to string for JSON compatibility,
+        # both steps are applied per value in a single walk
+        transformed_obj = _replace_values_in_place(
+            transformed_obj, _NUMBER_TYPES, _to_decimal_string
+        )
 
         transformed_objects.append(transformed_obj)
         _logger.debug(f"Transformed {obj_type} object for corpus key {new_corpus_key}")
@@ -154,7 +290,41 @@ def generate_test_bot_url(url_template, corpus_key):
 
 def generate_temporary_corpus_key():
     """Generate a unique temporary corpus key"""
-    return f"TEMP_{uuid.uuid4().hex[:10].upper()}"
+    return f"TEMP_{os.urandom(5).hex().upper()}"
+
+
+def load_yaml_documents(file):
+    """
+    Load all documents of a yaml file
+
+    Returns a tuple (is_multi_document, documents).
+    """
+    # a single document file is just a multi-document file with one document,
+    # empty documents (e.g. an empty file) are skipped
+    with open(file, "rb") as f:
+        documents = [
+            doc for doc in yaml.load_all(f, Loader=YAML_LOADER) if doc is not None
+        ]
+    return len(documents) > 1, documents
+
+
+YAML_FILE_SUFFIXES = frozenset((".yaml", ".yml"))
+
+
+def iter_yaml_files(root):
+    """
+    Yield the paths of all yaml files below root in a single directory walk,
+    symlinked directories are not followed
+    """
+    try:
+        entries = sorted(os.scandir(root), key=lambda entry: entry.name)
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from iter_yaml_files(entry.path)
+        elif os.path.splitext(entry.name)[1] in YAML_FILE_SUFFIXES:
+            yield Path(entry.path)
 
 
 def gather_json_representations(
@@ -175,24 +345,25 @@ def gather_json_representations(
 
     # traverse the directory tree and look for all yaml files
 
+    files = list(iter_yaml_files(path))
+    if len(files) > 1:
+        # map keeps the file order, so the result does not depend on timing
+        with ThreadPoolExecutor(
+            max_workers=min(len(files), MAX_PARALLEL_YAML_LOADS)
+        ) as executor:
+            loaded = list(executor.map(load_yaml_documents, files))
+    else:
+        loaded = [load_yaml_documents(file) for file in files]
+
     all_objects = []
-    for file in list(path.rglob("*.yaml")) + list(path.rglob("*.yml")):
-        with open(file, "r") as f:
-            had_error = False
-            try:
-                data = yaml.safe_load(f)
-                all_objects.append(data)
-            except yaml.composer.ComposerError as e:
-                had_error = True
-
-            if had_error:
-                # try loading as multi-document yaml
-                f.seek(0)
-                for i, doc in enumerate(yaml.safe_load_all(f)):
-                    all_objects.append(doc)
-                    _logger.info(
-                        f"Loaded document {i} from {file}:\n{json.dumps(doc, indent=2, ensure_ascii=False)}\n"
-                    )
+    for file, (is_multi_document, documents) in zip(files, loaded):
+        all_objects.extend(documents)
+
+        if is_multi_document:
+            for i, doc in enumerate(documents):
+                _logger.info(
+                    "Loaded document %s from %s:\n%s\n", i, file, LazyPrettyJson(doc)
+                )
 
     if include_messaging_aliases:
         repository_root = Path(__file__).resolve().parents[1]
@@ -208,8 +379,52 @@ def gather_json_representations(
     return all_objects
 
 
-if __name__ == "__main__":
-    logging.basicConfig(level=logging.INFO)
+def shard_objects(objects, shard_size):
+    """
+    Split objects into consecutive shards of at most shard_size objects.
+    A shard_size of 0 or less, or a list that fits, yields a single shard.
+    """
+    if shard_size <= 0 or len(objects) <= shard_size:
+        return [objects]
+    return [
+        objects[start : start + shard_size]
+        for start in range(0, len(objects), shard_size)
+    ]
+
+
+def invoke_deploy_lambda(lambda_client, lambda_function_name, request):
+    """
+    Invoke the deploy lambda synchronously and return the parsed response.
+    Raises RuntimeError if the invocation or the lambda function failed.
+    """
+    response = lambda_client.invoke(
+        FunctionName=lambda_function_name,
+        InvocationType="RequestResponse",
+        Payload=json_dumps_payload(request),
+    )
+
+    # Check the status code of the response
+    status_code = response.get("StatusCode")
+    if status_code != 200:
+        raise RuntimeError(f"Lambda invocation failed with status code: {status_code}")
+
+    # Parse the response payload
+    response_data = json_loads(response["Payload"].read())
+
+    # Check for errors in the response
+    for error_key in ("errorMessage", "error"):
+        if error_key in response_data:
+            _logger.debug("Error details: %s", LazyPrettyJson(response_data))
+            raise RuntimeError(f"Lambda function error: {response_data[error_key]}")
+
+    return response_data
+
+
+def main(argv=None):
+    """
+    Run the deployment for the given command line arguments (sys.argv when
+    None) and return the process exit code
+    """
     parser = argparse.ArgumentParser(
         description="Deploy configuration with lambda call"
     )
@@ -273,8 +488,15 @@ if __name__ == "__main__":
         default="corpus",
         help="Deploy corpus configuration or messaging provider records",
     )
+    parser.add_argument(
+        "--shard-size",
+        required=False,
+        type=int,
+        default=DEFAULT_SHARD_SIZE,
+        help=f"Maximum number of objects per lambda invocation, larger deployments are split into shards invoked in parallel and applied independently; 0 disables sharding (default: {DEFAULT_SHARD_SIZE})",
+    )
     # parse arguments
-    args, unknown = parser.parse_known_args()
+    args, unknown = parser.parse_known_args(argv)
 
     # Handle temporary corpus key
     temporary_corpus_key = args.temporary_corpus_key.strip()
@@ -323,8 +545,9 @@ if __name__ == "__main__":
         _logger.info(
             f"Transforming objects for temporary corpus key '{temporary_corpus_key}' with TTL of {args.temporary_corpus_key_ttl_hours} hours"
         )
+        # the gathered objects are fresh copies owned by this run
         objects_to_load = transform_for_temporary_corpus_key(
-            objects_to_load, temporary_corpus_key, ttl_seconds
+            objects_to_load, temporary_corpus_key, ttl_seconds, inplace=True
         )
 
         # Verify exactly one corpus key exists after transformation
@@ -337,7 +560,7 @@ if __name__ == "__main__":
             _logger.error(
                 f"Expected exactly one corpus key after transformation, found {len(corpus_keys)}: {corpus_keys}"
             )
-            exit(1)
+            return 1
 
         _logger.info(
             f"✅ Temporary deployment prepared with corpus key: {temporary_corpus_key} (expires in {args.temporary_corpus_key_ttl_hours} hours)"
@@ -366,14 +589,16 @@ if __name__ == "__main__":
         for i, obj in enumerate(objects_to_load):
             if "pk" not in obj:
                 _logger.error(
-                    f"Object {i} does not have a primary key. Object:\n{json.dumps(obj, indent=2, ensure_ascii=False)}"
+                    "Object %s does not have a primary key. Object: %.500r", i, obj
                 )
-                exit(1)
+                _logger.debug("Full object %s:\n%s", i, LazyPrettyJson(obj))
+                return 1
             if "sk" not in obj:
                 _logger.error(
-                    f"Object {i} does not have a sort key. Object:\n{json.dumps(obj, indent=2, ensure_ascii=False)}"
+                    "Object %s does not have a sort key. Object: %.500r", i, obj
                 )
-                exit(1)
+                _logger.debug("Full object %s:\n%s", i, LazyPrettyJson(obj))
+                return 1
 
             if args.configuration_scope == "messaging":
                 _logger.info(
@@ -384,7 +609,9 @@ if __name__ == "__main__":
                 )
             else:
                 _logger.info(
-                    f"Object {i}:\n{json.dumps(obj, indent=2, ensure_ascii=False)}\n--------------------------------\n"
+                    "Object %s:\n%s\n--------------------------------\n",
+                    i,
+                    LazyPrettyJson(obj),
                 )
     else:
         _logger.info(
@@ -394,9 +621,7 @@ if __name__ == "__main__":
             f"Prepared {len(objects_to_load)} objects for temporary deployment"
         )
         for i, obj in enumerate(objects_to_load):
-            _logger.info(
-                f"Temporary object {i}:\n{json.dumps(obj, indent=2, ensure_ascii=False)}"
-            )
+            _logger.info("Temporary object %s:\n%s", i, LazyPrettyJson(obj))
 
     request = {
         "objects_to_load": objects_to_load,
@@ -406,38 +631,50 @@ if __name__ == "__main__":
     # Create a Lambda client
     lambda_client = boto3.client("lambda")
 
-    try:
-        response = lambda_client.invoke(
-            FunctionName=args.lambda_function_name,
-            InvocationType="RequestResponse",
-            Payload=json.dumps(request),
-        )
+    shards = shard_objects(objects_to_load, args.shard_size)
+    start_time = time.perf_counter()
 
-        # Check the status code of the response
-        status_code = response.get("StatusCode")
-        if status_code != 200:
-            _logger.error(f"Lambda invocation failed with status code: {status_code}")
-            exit(1)
-
-        # Parse the response payload
-        response_payload = response["Payload"].read()
-        response_data = json.loads(response_payload)
-
-        # Check for errors in the response
-        if "errorMessage" in response_data:
-            _logger.error(f"Lambda function error: {response_data['errorMessage']}")
-            _logger.debug(f"Error details: {json.dumps(response_data, indent=2)}")
-            exit(1)
-        elif "error" in response_data:
-            _logger.error(f"Lambda function error: {response_data['error']}")
-            _logger.debug(f"Error details: {json.dumps(response_data, indent=2)}")
-            exit(1)
+    try:
+        if len(shards) == 1:
+            response_data = invoke_deploy_lambda(
+                lambda_client, args.lambda_function_name, request
+            )
+            _logger.info("Lambda response:\n%s", LazyPrettyJson(response_data))
         else:
-            _logger.info("Lambda invocation succeeded.")
             _logger.info(
-                f"Lambda response:\n{json.dumps(response_data, indent=2, ensure_ascii=False)}"
+                f"Deploying {len(objects_to_load)} objects in {len(shards)} shards of up to {args.shard_size} objects"
             )
+            with ThreadPoolExecutor(
+                max_workers=min(len(shards), MAX_PARALLEL_SHARD_INVOCATIONS)
+            ) as executor:
+                futures = [
+                    executor.submit(
+                        invoke_deploy_lambda,
+                        lambda_client,
+                        args.lambda_function_name,
+                        {**request, "objects_to_load": shard},
+                    )
+                    for shard in shards
+                ]
+                for shard_number, future in enumerate(futures, start=1):
+                    response_data = future.result()
+                    _logger.info(
+                        "Lambda response for shard %s/%s:\n%s",
+                        shard_number,
+                        len(shards),
+                        LazyPrettyJson(response_data),
+                    )
 
     except Exception as e:
         _logger.exception(f"Failed to invoke lambda function: {e}", exc_info=e)
-        exit(1)
+        return 1
+
+    _logger.info(
+        f"Lambda invocation succeeded in {time.perf_counter() - start_time:.2f}s."
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
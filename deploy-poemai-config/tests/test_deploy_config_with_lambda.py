@@ -1,3 +1,4 @@
+import datetime
 import json
 import logging
 import time
@@ -9,17 +10,46 @@ from unittest.mock import MagicMock, mock_open, patch
 import pytest
 import yaml
 from deploy_config_with_lambda_call import (
+    LazyPrettyJson,
     calc_obj_type,
     gather_json_representations,
     generate_temporary_corpus_key,
     generate_test_bot_url,
+    invoke_deploy_lambda,
+    iter_yaml_files,
+    json_dumps_payload,
+    json_dumps_pretty,
+    json_loads,
+    load_yaml_documents,
+    main,
     replace_decimal_with_string,
+    replace_decimal_with_string_inplace,
     replace_floats_with_decimal,
+    replace_floats_with_decimal_inplace,
+    shard_objects,
     transform_for_temporary_corpus_key,
 )
 
+try:
+    from yaml import CSafeDumper as YAML_DUMPER
+except ImportError:
+    from yaml import SafeDumper as YAML_DUMPER
+
 _logger = logging.getLogger(__name__)
 
+_ASSISTANT_YAML = """pk: "CORPUS_KEY#TEST_BOT"
+sk: "ASSISTANT_ID#test_assistant"
+assistant_id: "test_assistant"
+corpus_key: "TEST_BOT"
+name: "Test Assistant"
+"""
+
+_CORPUS_METADATA_YAML = """pk: "CORPUS_METADATA#TEST_BOT"
+sk: "CORPUS_KEY#TEST_BOT"
+corpus_key: "TEST_BOT"
+description: "Test corpus"
+"""
+
 
 class TestObjectTypeRecognition:
     """Test object type recognition functionality"""
@@ -100,6 +130,171 @@ class TestDataConversion:
         assert result["nested"]["another_decimal"] == "2.71"
         assert all(isinstance(x, str) for x in result["nested"]["list_with_decimals"])
 
+    def test_replace_values_deeply_nested(self):
+        """Test conversion of deeply nested data, top level lists and scalars"""
+        data = [{"values": [0.5, {"deep": 1.25}]}]
+        nested = data
+        for _ in range(2000):
+            nested = [nested]
+
+        result = replace_decimal_with_string_inplace(
+            replace_floats_with_decimal_inplace(nested)
+        )
+
+        for _ in range(2000):
+            result = result[0]
+        assert result == [{"values": ["0.5", {"deep": "1.25"}]}]
+        assert replace_floats_with_decimal(1.5) == Decimal("1.5")
+        assert replace_decimal_with_string(Decimal("1.5")) == "1.5"
+        assert replace_floats_with_decimal("text") == "text"
+
+    def test_replace_values_copies_or_modifies_in_place(self):
+        """Test that only the _inplace variants modify their argument"""
+        data = {"values": [0.5, {"deep": Decimal("1.25")}]}
+
+        assert replace_floats_with_decimal(data) == {
+            "values": [Decimal("0.5"), {"deep": Decimal("1.25")}]
+        }
+        assert replace_decimal_with_string(data) == {"values": [0.5, {"deep": "1.25"}]}
+        assert data == {"values": [0.5, {"deep": Decimal("1.25")}]}
+
+        assert replace_floats_with_decimal_inplace(data) is data
+        assert data == {"values": [Decimal("0.5"), {"deep": Decimal("1.25")}]}
+        assert replace_decimal_with_string_inplace(data) is data
+        assert data == {"values": ["0.5", {"deep": "1.25"}]}
+
+
+class TestJsonSerialization:
+    """Test JSON helpers used for the lambda payload and logging"""
+
+    def test_json_dumps_payload_roundtrip(self):
+        """Test that payloads are bytes and survive a roundtrip"""
+        request = {
+            "objects_to_load": [{"pk": "CORPUS_KEY#TEST", "name": "Zürich"}],
+            "poemai-environment": "staging",
+        }
+
+        payload = json_dumps_payload(request)
+
+        assert isinstance(payload, bytes)
+        assert json_loads(payload) == request
+        assert json.loads(payload) == request
+
+    def test_json_dumps_pretty_matches_json_module(self):
+        """Test that pretty output matches json.dumps(indent=2, ensure_ascii=False)"""
+        obj = {"assistant_id": "test", "name": "Zürich", "nested": {"values": [1, 2]}}
+
+        assert json_dumps_pretty(obj) == json.dumps(obj, indent=2, ensure_ascii=False)
+
+    def test_json_dumps_pretty_falls_back_to_json_module(self):
+        """Test that values orjson rejects are still serialized"""
+        obj = {"big": 2**70}
+
+        assert json_dumps_pretty(obj) == json.dumps(obj, indent=2, ensure_ascii=False)
+        assert json_loads(json_dumps_payload(obj)) == obj
+
+    def test_json_helpers_without_orjson(self, monkeypatch):
+        """Test that the json module is used when orjson is not installed"""
+        monkeypatch.setattr("deploy_config_with_lambda_call.ORJSON_AVAILABLE", False)
+        obj = {"name": "Zürich", "nested": {"values": [1, 2]}}
+        expected = json.dumps(obj, indent=2, ensure_ascii=False)
+
+        assert json_dumps_pretty(obj) == expected
+        assert str(LazyPrettyJson(obj)) == expected
+        assert json_loads(json_dumps_payload(obj)) == obj
+
+    @pytest.mark.parametrize("orjson_available", [True, False])
+    def test_json_helpers_reject_dates(self, monkeypatch, orjson_available):
+        """Test that unquoted yaml dates fail with and without orjson"""
+        if orjson_available:
+            pytest.importorskip("orjson")
+        monkeypatch.setattr(
+            "deploy_config_with_lambda_call.ORJSON_AVAILABLE", orjson_available
+        )
+        obj = {"valid_from": datetime.date(2024, 1, 1)}
+
+        with pytest.raises(TypeError):
+            json_dumps_payload(obj)
+        with pytest.raises(TypeError):
+            json_dumps_pretty(obj)
+
+    @pytest.mark.parametrize("orjson_available", [True, False])
+    def test_json_helpers_write_non_finite_floats_as_null(
+        self, monkeypatch, orjson_available
+    ):
+        """Test that NaN and infinity become null with and without orjson"""
+        if orjson_available:
+            pytest.importorskip("orjson")
+        monkeypatch.setattr(
+            "deploy_config_with_lambda_call.ORJSON_AVAILABLE", orjson_available
+        )
+        obj = {"values": [float("nan"), float("inf"), 1.5]}
+
+        assert json.loads(json_dumps_payload(obj)) == {"values": [None, None, 1.5]}
+        assert json.loads(json_dumps_pretty(obj)) == {"values": [None, None, 1.5]}
+        # The caller's object is left as is
+        assert obj["values"][1] == float("inf")
+
+    def test_lazy_pretty_json_serializes_only_when_formatted(self):
+        """Test that disabled log levels never serialize the object"""
+        obj = {"name": "Zürich"}
+
+        with patch("deploy_config_with_lambda_call.json_dumps_pretty") as dumps_mock:
+            logger = logging.getLogger("test_lazy_pretty_json")
+            logger.setLevel(logging.WARNING)
+            logger.info("Object:\n%s", LazyPrettyJson(obj))
+            dumps_mock.assert_not_called()
+
+        assert str(LazyPrettyJson(obj)) == json_dumps_pretty(obj)
+
+
+class TestLambdaSharding:
+    """Test splitting deployments into several lambda invocations"""
+
+    def test_shard_objects(self):
+        """Test that objects are split into consecutive shards"""
+        objects = [{"pk": f"CORPUS_KEY#{i}"} for i in range(5)]
+
+        assert shard_objects(objects, 2) == [objects[0:2], objects[2:4], objects[4:5]]
+        assert shard_objects(objects, 5) == [objects]
+        assert shard_objects(objects, 0) == [objects]
+        assert shard_objects([], 2) == [[]]
+
+    def test_invoke_deploy_lambda(self):
+        """Test that the request is sent as JSON and the response is parsed"""
+        lambda_client = MagicMock()
+        lambda_client.invoke.return_value = {
+            "StatusCode": 200,
+            "Payload": MagicMock(read=MagicMock(return_value=b'{"loaded": 1}')),
+        }
+        request = {"objects_to_load": [{"pk": "A"}], "poemai-environment": "test"}
+
+        assert invoke_deploy_lambda(lambda_client, "test-function", request) == {
+            "loaded": 1
+        }
+
+        call_kwargs = lambda_client.invoke.call_args.kwargs
+        assert call_kwargs["FunctionName"] == "test-function"
+        assert json.loads(call_kwargs["Payload"]) == request
+
+    def test_invoke_deploy_lambda_errors(self):
+        """Test that failed invocations and function errors raise"""
+        lambda_client = MagicMock()
+        lambda_client.invoke.return_value = {"StatusCode": 500}
+
+        with pytest.raises(RuntimeError, match="status code: 500"):
+            invoke_deploy_lambda(lambda_client, "test-function", {})
+
+        lambda_client.invoke.return_value = {
+            "StatusCode": 200,
+            "Payload": MagicMock(
+                read=MagicMock(return_value=b'{"errorMessage": "boom"}')
+            ),
+        }
+
+        with pytest.raises(RuntimeError, match="Lambda function error: boom"):
+            invoke_deploy_lambda(lambda_client, "test-function", {})
+
 
 class TestTemporaryCorpusKey:
     """Test temporary corpus key functionality"""
@@ -232,6 +427,34 @@ class TestTemporaryCorpusKey:
         )  # Should be string after conversion
         assert transformed["complex_data"]["nested"]["list"] == [1, 2, 3]
 
+    def test_transform_for_temporary_corpus_key_inplace(self):
+        """Test that inputs are copied by default and reused when inplace"""
+        objects = [
+            {
+                "pk": "CORPUS_KEY#test_corpus",
+                "sk": "ASSISTANT_ID#test_assistant",
+                "assistant_id": "test_assistant",
+                "corpus_key": "test_corpus",
+                "configuration": {"temperature": 0.7},
+            }
+        ]
+        ttl_seconds = int(time.time()) + 3600
+
+        copied = transform_for_temporary_corpus_key(objects, "TEMP_TEST", ttl_seconds)
+
+        assert copied[0] is not objects[0]
+        assert objects[0]["pk"] == "CORPUS_KEY#test_corpus"
+        assert objects[0]["configuration"]["temperature"] == 0.7
+
+        transformed = transform_for_temporary_corpus_key(
+            objects, "TEMP_TEST", ttl_seconds, inplace=True
+        )
+
+        assert transformed[0] is objects[0]
+        assert "pk" not in objects[0]
+        assert objects[0]["corpus_key"] == "TEMP_TEST"
+        assert objects[0]["configuration"]["temperature"] == "0.7"
+
 
 class TestURLGeneration:
     """Test URL generation functionality"""
@@ -292,28 +515,9 @@ class TestFileGathering:
         )
         corpus_keys_dir.mkdir(parents=True)
 
-        # Create test YAML files
-        assistant_config = {
-            "pk": "CORPUS_KEY#TEST_BOT",
-            "sk": "ASSISTANT_ID#test_assistant",
-            "assistant_id": "test_assistant",
-            "corpus_key": "TEST_BOT",
-            "name": "Test Assistant",
-        }
-
-        corpus_metadata_config = {
-            "pk": "CORPUS_METADATA#TEST_BOT",
-            "sk": "CORPUS_KEY#TEST_BOT",
-            "corpus_key": "TEST_BOT",
-            "description": "Test corpus",
-        }
-
         # Write YAML files
-        with open(corpus_keys_dir / "assistant.yaml", "w") as f:
-            yaml.dump(assistant_config, f)
-
-        with open(corpus_keys_dir / "corpus_metadata.yml", "w") as f:
-            yaml.dump(corpus_metadata_config, f)
+        (corpus_keys_dir / "assistant.yaml").write_text(_ASSISTANT_YAML)
+        (corpus_keys_dir / "corpus_metadata.yml").write_text(_CORPUS_METADATA_YAML)
 
         # Test gathering
         result = gather_json_representations("staging", str(tempdir))
@@ -368,10 +572,91 @@ corpus_key: "MULTI_BOT"
 
         assert len(result) == 0
 
+    def test_gather_json_representations_keeps_file_order(self, tmpdir):
+        """Test that files loaded in parallel are returned in directory order"""
+        tempdir = Path(tmpdir)
+        corpus_keys_dir = tempdir / "environments" / "test" / "corpus_keys"
+        corpus_keys_dir.mkdir(parents=True)
+        for i in range(20):
+            (corpus_keys_dir / f"assistant_{i:02d}.yaml").write_text(
+                f'assistant_id: "assistant_{i:02d}"\n'
+            )
+
+        result = gather_json_representations(
+            "test", str(tempdir), include_messaging_aliases=False
+        )
+
+        assert [obj["assistant_id"] for obj in result] == [
+            f"assistant_{i:02d}" for i in range(20)
+        ]
+
+    def test_iter_yaml_files(self, tmpdir):
+        """Test that the directory walk yields .yaml and .yml files only"""
+        tempdir = Path(tmpdir)
+        (tempdir / "BOT_A" / "nested").mkdir(parents=True)
+        (tempdir / "BOT_A" / "assistant.yaml").write_text("a: 1\n")
+        (tempdir / "BOT_A" / "nested" / "metadata.yml").write_text("b: 2\n")
+        (tempdir / "BOT_A" / "README.md").write_text("# not yaml\n")
+        (tempdir / "empty.yaml").write_text("")
+
+        found = sorted(
+            p.relative_to(tempdir).as_posix() for p in iter_yaml_files(tempdir)
+        )
+
+        assert found == [
+            "BOT_A/assistant.yaml",
+            "BOT_A/nested/metadata.yml",
+            "empty.yaml",
+        ]
+        assert list(iter_yaml_files(tempdir / "missing")) == []
+
+        # Empty documents do not end up as objects
+        assert load_yaml_documents(tempdir / "empty.yaml") == (False, [])
+
+    def test_iter_yaml_files_skips_symlinked_directories(self, tmp_path):
+        """Test that symlinked directories and symlink loops are not walked"""
+        root = tmp_path / "corpus_keys"
+        (root / "BOT_A").mkdir(parents=True)
+        (root / "BOT_A" / "assistant.yaml").write_text("a: 1\n")
+        outside = tmp_path / "outside"
+        outside.mkdir()
+        (outside / "other.yaml").write_text("b: 2\n")
+        (root / "linked").symlink_to(outside, target_is_directory=True)
+        (root / "BOT_A" / "loop").symlink_to(root, target_is_directory=True)
+
+        found = [p.relative_to(root).as_posix() for p in iter_yaml_files(root)]
+
+        assert found == ["BOT_A/assistant.yaml"]
+
+    def test_load_yaml_documents(self, tmpdir):
+        """Test that single and multi document files are told apart"""
+        yaml_file = Path(tmpdir) / "assistant.yaml"
+        yaml_file.write_text('assistant_id: "first"\n')
+
+        assert load_yaml_documents(yaml_file) == (False, [{"assistant_id": "first"}])
+
+        yaml_file.write_text('assistant_id: "a"\n---\nassistant_id: "b"\n')
+        assert load_yaml_documents(yaml_file) == (
+            True,
+            [{"assistant_id": "a"}, {"assistant_id": "b"}],
+        )
+
 
 class TestMainFunctionality:
     """Test main script functionality with mocked AWS calls"""
 
+    @staticmethod
+    def _run_main_with_one_object():
+        with patch(
+            "deploy_config_with_lambda_call.gather_json_representations"
+        ) as mock_gather:
+            mock_gather.return_value = [
+                {"pk": "CORPUS_KEY#TEST_BOT", "sk": "ASSISTANT_ID#test_assistant"}
+            ]
+            return main(
+                ["--environment", "staging", "--lambda-function-name", "test-function"]
+            )
+
     @patch("deploy_config_with_lambda_call.boto3")
     def test_successful_lambda_invocation(self, mock_boto3):
         """Test successful Lambda function invocation"""
@@ -401,25 +686,81 @@ class TestMainFunctionality:
         ) as mock_gather:
             mock_gather.return_value = test_objects
 
-            # Import and test main functionality
-            import subprocess
-            import sys
-
-            # Test via subprocess to avoid sys.exit() issues
-            cmd = [
-                sys.executable,
-                "-c",
-                """
-from deploy_config_with_lambda_call import *
-import sys
-sys.argv = ['deploy_config_with_lambda_call.py', '--environment', 'staging', '--lambda-function-name', 'test-function']
-if __name__ == '__main__':
-    pass  # Avoid running main in test
-""",
-            ]
+            exit_code = main(
+                ["--environment", "staging", "--lambda-function-name", "test-function"]
+            )
+
+        assert exit_code == 0
+        mock_lambda_client.invoke.assert_called_once()
+        payload = json_loads(mock_lambda_client.invoke.call_args.kwargs["Payload"])
+        assert payload["objects_to_load"] == test_objects
+        assert payload["poemai-environment"] == "staging"
+
+    @staticmethod
+    def _run_main_with_shards(test_objects, invoke_side_effect):
+        with patch(
+            "deploy_config_with_lambda_call.gather_json_representations"
+        ) as mock_gather, patch("deploy_config_with_lambda_call.boto3"), patch(
+            "deploy_config_with_lambda_call.invoke_deploy_lambda"
+        ) as mock_invoke:
+            mock_gather.return_value = test_objects
+            mock_invoke.side_effect = invoke_side_effect
+
+            exit_code = main(
+                [
+                    "--environment",
+                    "staging",
+                    "--lambda-function-name",
+                    "test-function",
+                    "--shard-size",
+                    "2",
+                ]
+            )
+        return exit_code, mock_invoke
+
+    def test_sharded_lambda_invocation(self):
+        """Test that each shard is sent with the rest of the request"""
+        test_objects = [
+            {"pk": f"CORPUS_KEY#TEST_BOT_{i}", "sk": f"ASSISTANT_ID#assistant_{i}"}
+            for i in range(5)
+        ]
+
+        exit_code, mock_invoke = self._run_main_with_shards(
+            test_objects, lambda client, function_name, request: {"status": "ok"}
+        )
+
+        assert exit_code == 0
+        assert mock_invoke.call_count == 3
+        requests = []
+        for call in mock_invoke.call_args_list:
+            _, function_name, request = call.args
+            requests.append(request)
+            assert function_name == "test-function"
+            assert request == {
+                "objects_to_load": request["objects_to_load"],
+                "poemai-environment": "staging",
+            }
+            assert 1 <= len(request["objects_to_load"]) <= 2
+        # Shards run in parallel, put them back in submission order
+        requests.sort(key=lambda r: test_objects.index(r["objects_to_load"][0]))
+        assert [obj for r in requests for obj in r["objects_to_load"]] == test_objects
+
+    def test_sharded_lambda_invocation_failing_shard(self):
+        """Test that one failing shard fails the deployment"""
+        test_objects = [
+            {"pk": f"CORPUS_KEY#TEST_BOT_{i}", "sk": f"ASSISTANT_ID#assistant_{i}"}
+            for i in range(5)
+        ]
 
-            # Just test that imports work correctly
-            assert True  # If we get here, imports work
+        def invoke(client, function_name, request):
+            if request["objects_to_load"][0] is test_objects[2]:
+                raise RuntimeError("Lambda function returned error")
+            return {"status": "ok"}
+
+        exit_code, mock_invoke = self._run_main_with_shards(test_objects, invoke)
+
+        assert exit_code == 1
+        assert mock_invoke.call_count == 3
 
     @patch("deploy_config_with_lambda_call.boto3")
     def test_lambda_invocation_error_response(self, mock_boto3):
@@ -435,9 +776,7 @@ if __name__ == '__main__':
         )
         mock_lambda_client.invoke.return_value = mock_response
 
-        # This would typically cause sys.exit(1) in the main script
-        # We just test that the error handling path exists
-        assert True
+        assert self._run_main_with_one_object() == 1
 
     @patch("deploy_config_with_lambda_call.boto3")
     def test_lambda_invocation_exception(self, mock_boto3):
@@ -447,9 +786,7 @@ if __name__ == '__main__':
         mock_boto3.client.return_value = mock_lambda_client
         mock_lambda_client.invoke.side_effect = Exception("Network error")
 
-        # This would typically cause sys.exit(1) in the main script
-        # We just test that the exception handling path exists
-        assert True
+        assert self._run_main_with_one_object() == 1
 
 
 class TestArgumentParsing:
@@ -664,7 +1001,7 @@ class TestTargetEnvironment:
         }
 
         with open(production_dir / "assistant.yaml", "w") as f:
-            yaml.dump(prod_config, f)
+            yaml.dump(prod_config, f, Dumper=YAML_DUMPER)
 
         # Test loading from production environment
         objects = gather_json_representations("production", str(tempdir))
@@ -750,7 +1087,7 @@ class TestTargetEnvironment:
         configs = [corpus_metadata, assistant_config, case_manager_config]
         for i, config in enumerate(configs):
             with open(production_dir / f"config_{i}.yaml", "w") as f:
-                yaml.dump(config, f)
+                yaml.dump(config, f, Dumper=YAML_DUMPER)
 
         # Simulate the cross-deployment workflow
 
@@ -861,7 +1198,7 @@ class TestIntegrationScenarios:
         # Write configurations
         for i, config in enumerate(configs):
             with open(corpus_keys_dir / f"config_{i}.yaml", "w") as f:
-                yaml.dump(config, f)
+                yaml.dump(config, f, Dumper=YAML_DUMPER)
 
         # Test gathering
         objects = gather_json_representations("staging", str(tempdir))
@@ -897,16 +1234,7 @@ class TestIntegrationScenarios:
         corpus_keys_dir = tempdir / "environments" / "test" / "corpus_keys"
         corpus_keys_dir.mkdir(parents=True)
 
-        # Create simple config
-        config = {
-            "pk": "CORPUS_KEY#TEST_BOT",
-            "sk": "ASSISTANT_ID#test_assistant",
-            "assistant_id": "test_assistant",
-            "corpus_key": "TEST_BOT",
-        }
-
-        with open(corpus_keys_dir / "assistant.yaml", "w") as f:
-            yaml.dump(config, f)
+        (corpus_keys_dir / "assistant.yaml").write_text(_ASSISTANT_YAML)
 
         objects = gather_json_representations("test", str(tempdir))
 
@@ -932,7 +1260,7 @@ class TestIntegrationScenarios:
         }
 
         with open(corpus_keys_dir / "invalid.yaml", "w") as f:
-            yaml.dump(invalid_config, f)
+            yaml.dump(invalid_config, f, Dumper=YAML_DUMPER)
 
         objects = gather_json_representations("test", str(tempdir))
 
@@ -965,7 +1293,7 @@ class TestValidationLogic:
         }
 
         with open(corpus_keys_dir / "invalid.yaml", "w") as f:
-            yaml.dump(invalid_config, f)
+            yaml.dump(invalid_config, f, Dumper=YAML_DUMPER)
 
         objects = gather_json_representations("test", str(tempdir))
 
@@ -1100,10 +1428,10 @@ class TestValidationLogic:
         }
 
         with open(corpus_keys_dir / "valid.yaml", "w") as f:
-            yaml.dump(valid_config, f)
+            yaml.dump(valid_config, f, Dumper=YAML_DUMPER)
 
         with open(corpus_keys_dir / "invalid.yaml", "w") as f:
-            yaml.dump(invalid_config, f)
+            yaml.dump(invalid_config, f, Dumper=YAML_DUMPER)
 
         objects = gather_json_representations("test", str(tempdir))
         assert len(objects) == 2
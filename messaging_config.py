@@ -7,6 +7,11 @@ import yaml
 from poemai_utils.aws.dao_helper import DaoHelper
 from poemai_utils.enum_utils import add_enum_attrs, add_enum_repr
 
+try:
+    from yaml import CSafeLoader as YAML_LOADER
+except ImportError:
+    from yaml import SafeLoader as YAML_LOADER
+
 SUPPORTED_PROVIDER = "meta"
 SUPPORTED_CHANNEL = "whatsapp"
 CALLBACK_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
@@ -184,8 +189,8 @@ def provider_config_path(project_root_path, environment):
 
 
 def _read_yaml(path):
-    with open(path, "r", encoding="utf-8") as config_file:
-        return yaml.safe_load(config_file)
+    with open(path, "rb") as config_file:
+        return yaml.load(config_file, Loader=YAML_LOADER)
 
 
 def load_provider_objects(project_root_path, environment):
@@ -1,235 +1,25 @@
 """Tests for the unified versions file updater."""
 
-import os
-
-# Add the parent directory to the path so we can import our module
-import sys
-import tempfile
+import argparse
 from pathlib import Path
-from unittest.mock import MagicMock, patch
+from unittest.mock import MagicMock
 
 import pytest
+import update_versions_file
 import yaml
+from botocore.exceptions import ClientError, NoCredentialsError
+from update_versions_file import VersionsFileUpdater, detect_build_type, main
 
-sys.path.insert(0, str(Path(__file__).parent.parent))
-
-import argparse
-
-from update_versions_file import VersionsFileUpdater, detect_build_type
-
-
-class TestVersionsFileUpdater:
-    """Test cases for VersionsFileUpdater class."""
-
-    def test_create_new_file_regular_build(self):
-        """Test creating a new versions file for a regular build."""
-        with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".yaml") as f:
-            temp_file = f.name
-
-        try:
-            # Remove the file so we test creation
-            os.unlink(temp_file)
-
-            updater = VersionsFileUpdater(temp_file)
-            result = updater.update_regular_build("poemAI-ch/test-repo", "abc123def456")
-
-            assert result is True
-            assert Path(temp_file).exists()
-
-            with open(temp_file, "r") as f:
-                data = yaml.safe_load(f)
-
-            assert data == {"versions": {"poemAI-ch/test-repo": "abc123def456"}}
-        finally:
-            if os.path.exists(temp_file):
-                os.unlink(temp_file)
-
-    def test_update_existing_file_regular_build(self):
-        """Test updating an existing versions file for a regular build."""
-        with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".yaml") as f:
-            # Create initial content
-            initial_data = {
-                "versions": {
-                    "poemAI-ch/other-repo": "old123",
-                    "poemAI-ch/test-repo": "old456",
-                }
-            }
-            yaml.safe_dump(initial_data, f)
-            temp_file = f.name
-
-        try:
-            updater = VersionsFileUpdater(temp_file)
-            result = updater.update_regular_build("poemAI-ch/test-repo", "abc789def")
-
-            assert result is True
-
-            with open(temp_file, "r") as f:
-                data = yaml.safe_load(f)
-
-            expected = {
-                "versions": {
-                    "poemAI-ch/other-repo": "old123",
-                    "poemAI-ch/test-repo": "abc789def",
-                }
-            }
-            assert data == expected
-        finally:
-            os.unlink(temp_file)
-
-    def test_no_update_needed_regular_build(self):
-        """Test when no update is needed for a regular build."""
-        with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".yaml") as f:
-            initial_data = {"versions": {"poemAI-ch/test-repo": "abc123def456"}}
-            yaml.safe_dump(initial_data, f)
-            temp_file = f.name
-
-        try:
-            updater = VersionsFileUpdater(temp_file)
-            result = updater.update_regular_build("poemAI-ch/test-repo", "abc123def456")
-
-            assert result is False
-        finally:
-            os.unlink(temp_file)
-
-    def test_create_new_file_hash_based_build(self):
-        """Test creating a new versions file for a hash-based build."""
-        with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".yaml") as f:
-            temp_file = f.name
-
-        try:
-            # Remove the file so we test creation
-            os.unlink(temp_file)
-
-            updater = VersionsFileUpdater(temp_file)
-            result = updater.update_hash_based_build(
-                "poemAI-ch/test-lambdas", "s3://bucket/manifest.json"
-            )
-
-            assert result is True
-            assert Path(temp_file).exists()
-
-            with open(temp_file, "r") as f:
-                data = yaml.safe_load(f)
-
-            assert data == {
-                "versions": {},
-                "hash_based_lambdas": {
-                    "poemAI-ch/test-lambdas": "s3://bucket/manifest.json"
-                },
-            }
-        finally:
-            if os.path.exists(temp_file):
-                os.unlink(temp_file)
-
-    def test_update_existing_file_hash_based_build(self):
-        """Test updating an existing versions file for a hash-based build."""
-        with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".yaml") as f:
-            initial_data = {
-                "versions": {"poemAI-ch/regular-repo": "sha123"},
-                "hash_based_lambdas": {
-                    "poemAI-ch/other-lambdas": "s3://bucket/old.json"
-                },
-            }
-            yaml.safe_dump(initial_data, f)
-            temp_file = f.name
-
-        try:
-            updater = VersionsFileUpdater(temp_file)
-            result = updater.update_hash_based_build(
-                "poemAI-ch/test-lambdas", "s3://bucket/new.json"
-            )
-
-            assert result is True
-
-            with open(temp_file, "r") as f:
-                data = yaml.safe_load(f)
-
-            expected = {
-                "versions": {"poemAI-ch/regular-repo": "sha123"},
-                "hash_based_lambdas": {
-                    "poemAI-ch/other-lambdas": "s3://bucket/old.json",
-                    "poemAI-ch/test-lambdas": "s3://bucket/new.json",
-                },
-            }
-            assert data == expected
-        finally:
-            os.unlink(temp_file)
-
-    def test_no_update_needed_hash_based_build(self):
-        """Test when no update is needed for a hash-based build."""
-        with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".yaml") as f:
-            initial_data = {
-                "hash_based_lambdas": {
-                    "poemAI-ch/test-lambdas": "s3://bucket/manifest.json"
-                }
-            }
-            yaml.safe_dump(initial_data, f)
-            temp_file = f.name
-
-        try:
-            updater = VersionsFileUpdater(temp_file)
-            result = updater.update_hash_based_build(
-                "poemAI-ch/test-lambdas", "s3://bucket/manifest.json"
-            )
-
-            assert result is False
-        finally:
-            os.unlink(temp_file)
-
-    def test_invalid_sha_regular_build(self):
-        """Test validation for invalid SHA in regular build."""
-        with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".yaml") as f:
-            temp_file = f.name
+try:
+    from yaml import CSafeDumper as YAML_DUMPER
+    from yaml import CSafeLoader as YAML_LOADER
+except ImportError:
+    from yaml import SafeDumper as YAML_DUMPER
+    from yaml import SafeLoader as YAML_LOADER
 
-        try:
-            updater = VersionsFileUpdater(temp_file)
 
-            with pytest.raises(ValueError, match="Invalid SHA"):
-                updater.update_regular_build("poemAI-ch/test-repo", "invalid-sha!")
-
-            with pytest.raises(ValueError, match="Invalid SHA"):
-                updater.update_regular_build("poemAI-ch/test-repo", "")
-        finally:
-            os.unlink(temp_file)
-
-    def test_empty_repo_name(self):
-        """Test validation for empty repository name."""
-        with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".yaml") as f:
-            temp_file = f.name
-
-        try:
-            updater = VersionsFileUpdater(temp_file)
-
-            with pytest.raises(ValueError, match="Empty repository name"):
-                updater.update_regular_build("", "abc123")
-
-            with pytest.raises(ValueError, match="Empty repository name"):
-                updater.update_hash_based_build("", "s3://bucket/manifest.json")
-        finally:
-            os.unlink(temp_file)
-
-    def test_empty_manifest_url(self):
-        """Test validation for empty manifest URL in hash-based build."""
-        with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".yaml") as f:
-            temp_file = f.name
-
-        try:
-            updater = VersionsFileUpdater(temp_file)
-
-            with pytest.raises(ValueError, match="Empty manifest URL"):
-                updater.update_hash_based_build("poemAI-ch/test-repo", "")
-        finally:
-            os.unlink(temp_file)
-
-    @patch("update_versions_file.boto3")
-    def test_hash_based_build_with_s3_manifest(self, mock_boto3):
-        """Test hash-based build with successful S3 manifest download."""
-        # Setup mock S3 client
-        mock_s3_client = MagicMock()
-        mock_boto3.client.return_value = mock_s3_client
-
-        # Mock S3 response with realistic manifest data from production
-        manifest_yaml = """versions:
+# Realistic manifest data from production, as S3 returns it
+_MANIFEST_BYTES = b"""versions:
   llm_stream_get: 9eb7be765a8e
   femto_semantic: e062e019c87b
   sessions_tokens: 07ea2c43918f
@@ -260,241 +50,381 @@ build_info:
   platform: linux/amd64
   branch: main
 """
-        mock_response = {"Body": MagicMock()}
-        mock_response["Body"].read.return_value = manifest_yaml.encode("utf-8")
-        mock_s3_client.get_object.return_value = mock_response
 
-        with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".yaml") as f:
-            initial_data = {
-                "versions": {
-                    "poemAI-ch/other-repo": "old123",
-                    "poemAI-ch/poemai-lambdas#group_summary_builder": "oldversion123",
-                }
-            }
-            yaml.safe_dump(initial_data, f)
-            temp_file = f.name
-
-        try:
-            updater = VersionsFileUpdater(temp_file)
-            result = updater.update_hash_based_build(
-                "poemAI-ch/poemai-lambdas",
-                "s3://poemai-artifacts/hash-based-manifests/poemai-lambdas/96b50db9f821ac594b65d1d43e421db50e490a76/lambda_versions.yaml",
-            )
-
-            assert result is True
-
-            # Verify S3 client was called correctly
-            mock_boto3.client.assert_called_once_with("s3", region_name="eu-central-2")
-            mock_s3_client.get_object.assert_called_once_with(
-                Bucket="poemai-artifacts",
-                Key="hash-based-manifests/poemai-lambdas/96b50db9f821ac594b65d1d43e421db50e490a76/lambda_versions.yaml",
-            )
-
-            # Check the updated file
-            with open(temp_file, "r") as f:
-                data = yaml.safe_load(f)
-
-            # Verify structure
-            assert "versions" in data
-            assert "hash_based_lambdas" in data
-
-            # Verify specific lambda versions were updated correctly
-            assert (
-                data["versions"]["poemAI-ch/poemai-lambdas#group_summary_builder"]
-                == "d344e6896fe2"
-            )
-            assert (
-                data["versions"]["poemAI-ch/poemai-lambdas#auth_proxy"]
-                == "42cc5172fccb"
-            )
-            assert (
-                data["versions"]["poemAI-ch/poemai-lambdas#llm_stream_get"]
-                == "9eb7be765a8e"
-            )
-            assert (
-                data["versions"]["poemAI-ch/poemai-lambdas#rule_engine"]
-                == "48136ea57187"
-            )
-
-            # Verify non-lambda versions were preserved
-            assert data["versions"]["poemAI-ch/other-repo"] == "old123"
-
-            # Verify manifest URL was updated
-            assert (
-                data["hash_based_lambdas"]["poemAI-ch/poemai-lambdas"]
-                == "s3://poemai-artifacts/hash-based-manifests/poemai-lambdas/96b50db9f821ac594b65d1d43e421db50e490a76/lambda_versions.yaml"
-            )
-
-        finally:
-            os.unlink(temp_file)
-
-    @patch("update_versions_file.boto3")
-    def test_hash_based_build_s3_failure_fallback(self, mock_boto3):
-        """Test hash-based build with S3 failure falls back to manifest URL only."""
-        # Setup mock S3 client that raises an error
-        mock_s3_client = MagicMock()
-        mock_boto3.client.return_value = mock_s3_client
 
-        from botocore.exceptions import ClientError
+@pytest.fixture(autouse=True)
+def mock_boto3(monkeypatch):
+    """Replace boto3 so no test reaches AWS, S3 downloads fail as they do
+    without credentials unless a test sets up get_object"""
+    mock_boto3 = MagicMock()
+    mock_boto3.client.return_value.get_object.side_effect = NoCredentialsError()
+    monkeypatch.setattr(update_versions_file, "boto3", mock_boto3)
+    return mock_boto3
 
-        error_response = {"Error": {"Code": "NoSuchKey", "Message": "Key not found"}}
-        mock_s3_client.get_object.side_effect = ClientError(error_response, "GetObject")
 
-        with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".yaml") as f:
-            initial_data = {"versions": {"poemAI-ch/other-repo": "old123"}}
-            yaml.safe_dump(initial_data, f)
-            temp_file = f.name
+@pytest.fixture
+def versions_path(tmp_path):
+    """Path of a versions file that does not exist yet"""
+    return str(tmp_path / "versions.yaml")
 
-        try:
-            updater = VersionsFileUpdater(temp_file)
-            result = updater.update_hash_based_build(
-                "poemAI-ch/test-lambdas", "s3://test-bucket/nonexistent.yaml"
-            )
 
-            assert result is True
+@pytest.fixture
+def updater(versions_path):
+    """Updater for a versions file that does not exist yet"""
+    return VersionsFileUpdater(versions_path)
 
-            # Check the updated file - should only have manifest URL, no individual lambdas
-            with open(temp_file, "r") as f:
-                data = yaml.safe_load(f)
 
-            expected = {
-                "versions": {"poemAI-ch/other-repo": "old123"},  # Unchanged
-                "hash_based_lambdas": {
-                    "poemAI-ch/test-lambdas": "s3://test-bucket/nonexistent.yaml"
-                },
-            }
-            assert data == expected
-        finally:
-            os.unlink(temp_file)
+def _write_versions_file(versions_path, data):
+    Path(versions_path).write_text(yaml.dump(data, Dumper=YAML_DUMPER))
 
-    def test_parse_s3_url(self):
-        """Test S3 URL parsing."""
-        with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".yaml") as f:
-            temp_file = f.name
 
-        try:
-            updater = VersionsFileUpdater(temp_file)
+def _read_versions_file(versions_path):
+    with open(versions_path, "r") as f:
+        return yaml.load(f, Loader=YAML_LOADER)
+
+
+class TestVersionsFileUpdater:
+    """Test cases for VersionsFileUpdater class."""
+
+    @pytest.mark.parametrize(
+        "initial_data, method, args, expected_result, expected_data",
+        [
+            pytest.param(
+                None,
+                "update_regular_build",
+                ("poemAI-ch/test-repo", "abc123def456"),
+                True,
+                {"versions": {"poemAI-ch/test-repo": "abc123def456"}},
+                id="create-new-file-regular-build",
+            ),
+            pytest.param(
+                {
+                    "versions": {
+                        "poemAI-ch/other-repo": "old123",
+                        "poemAI-ch/test-repo": "old456",
+                    }
+                },
+                "update_regular_build",
+                ("poemAI-ch/test-repo", "abc789def"),
+                True,
+                {
+                    "versions": {
+                        "poemAI-ch/other-repo": "old123",
+                        "poemAI-ch/test-repo": "abc789def",
+                    }
+                },
+                id="update-existing-file-regular-build",
+            ),
+            pytest.param(
+                {"versions": {"poemAI-ch/test-repo": "abc123def456"}},
+                "update_regular_build",
+                ("poemAI-ch/test-repo", "abc123def456"),
+                False,
+                {"versions": {"poemAI-ch/test-repo": "abc123def456"}},
+                id="no-update-needed-regular-build",
+            ),
+            pytest.param(
+                {"versions": {"poemAI-ch/test-repo": "0123"}},
+                "update_regular_build",
+                ("poemAI-ch/test-repo", "0123"),
+                False,
+                {"versions": {"poemAI-ch/test-repo": "0123"}},
+                id="no-update-needed-numeric-looking-sha",
+            ),
+            pytest.param(
+                None,
+                "update_hash_based_build",
+                ("poemAI-ch/test-lambdas", "s3://bucket/manifest.json"),
+                True,
+                {
+                    "versions": {},
+                    "hash_based_lambdas": {
+                        "poemAI-ch/test-lambdas": "s3://bucket/manifest.json"
+                    },
+                },
+                id="create-new-file-hash-based-build",
+            ),
+            pytest.param(
+                {
+                    "versions": {"poemAI-ch/regular-repo": "sha123"},
+                    "hash_based_lambdas": {
+                        "poemAI-ch/other-lambdas": "s3://bucket/old.json"
+                    },
+                },
+                "update_hash_based_build",
+                ("poemAI-ch/test-lambdas", "s3://bucket/new.json"),
+                True,
+                {
+                    "versions": {"poemAI-ch/regular-repo": "sha123"},
+                    "hash_based_lambdas": {
+                        "poemAI-ch/other-lambdas": "s3://bucket/old.json",
+                        "poemAI-ch/test-lambdas": "s3://bucket/new.json",
+                    },
+                },
+                id="update-existing-file-hash-based-build",
+            ),
+            pytest.param(
+                {
+                    "hash_based_lambdas": {
+                        "poemAI-ch/test-lambdas": "s3://bucket/manifest.json"
+                    }
+                },
+                "update_hash_based_build",
+                ("poemAI-ch/test-lambdas", "s3://bucket/manifest.json"),
+                False,
+                {
+                    "hash_based_lambdas": {
+                        "poemAI-ch/test-lambdas": "s3://bucket/manifest.json"
+                    }
+                },
+                id="no-update-needed-hash-based-build",
+            ),
+        ],
+    )
+    def test_update_versions_file(
+        self,
+        versions_path,
+        initial_data,
+        method,
+        args,
+        expected_result,
+        expected_data,
+    ):
+        """Test creating, updating and leaving versions files unchanged."""
+        if initial_data is not None:
+            _write_versions_file(versions_path, initial_data)
+
+        updater = VersionsFileUpdater(versions_path)
+        result = getattr(updater, method)(*args)
+
+        assert result is expected_result
+        assert _read_versions_file(versions_path) == expected_data
+
+    def test_invalid_sha_regular_build(self, updater):
+        """Test validation for invalid SHA in regular build."""
+        with pytest.raises(ValueError, match="Invalid SHA"):
+            updater.update_regular_build("poemAI-ch/test-repo", "invalid-sha!")
+
+        with pytest.raises(ValueError, match="Invalid SHA"):
+            updater.update_regular_build("poemAI-ch/test-repo", "")
 
-            # Valid S3 URLs
-            bucket, key = updater._parse_s3_url("s3://my-bucket/path/to/file.yaml")
-            assert bucket == "my-bucket"
-            assert key == "path/to/file.yaml"
+    def test_empty_repo_name(self, updater):
+        """Test validation for empty repository name."""
+        with pytest.raises(ValueError, match="Empty repository name"):
+            updater.update_regular_build("", "abc123")
 
-            bucket, key = updater._parse_s3_url("s3://test-bucket/manifest.json")
-            assert bucket == "test-bucket"
-            assert key == "manifest.json"
+        with pytest.raises(ValueError, match="Empty repository name"):
+            updater.update_hash_based_build("", "s3://bucket/manifest.json")
 
-            # Invalid S3 URLs
-            with pytest.raises(ValueError, match="Invalid S3 URL format"):
-                updater._parse_s3_url("https://example.com/file.yaml")
+    def test_empty_manifest_url(self, updater):
+        """Test validation for empty manifest URL in hash-based build."""
+        with pytest.raises(ValueError, match="Empty manifest URL"):
+            updater.update_hash_based_build("poemAI-ch/test-repo", "")
 
-            with pytest.raises(ValueError, match="Invalid S3 URL format"):
-                updater._parse_s3_url("s3://bucket-only")
+    def test_hash_based_build_with_s3_manifest(self, mock_boto3, versions_path):
+        """Test hash-based build with successful S3 manifest download."""
+        # Setup mock S3 client
+        mock_s3_client = mock_boto3.client.return_value
+        mock_s3_client.get_object.side_effect = None
 
-        finally:
-            os.unlink(temp_file)
+        mock_response = {"Body": MagicMock()}
+        mock_response["Body"].read.return_value = _MANIFEST_BYTES
+        mock_s3_client.get_object.return_value = mock_response
 
-    def test_extract_lambda_versions(self):
-        """Test lambda version extraction from manifest data."""
-        with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".yaml") as f:
-            temp_file = f.name
-
-        try:
-            updater = VersionsFileUpdater(temp_file)
-
-            # Valid manifest data with versions section (like actual S3 manifest)
-            manifest_data = {
-                "versions": {
-                    "lambda1": "abc123def456",
-                    "lambda2": "def456ghi789",
-                    "lambda3": "ghi789jkl012",
-                },
-                "build_info": {
-                    "timestamp": "2024-09-18T10:00:00Z",
-                    "commit": "abcd1234",
-                },
+        initial_data = {
+            "versions": {
+                "poemAI-ch/other-repo": "old123",
+                "poemAI-ch/poemai-lambdas#group_summary_builder": "oldversion123",
             }
+        }
+        _write_versions_file(versions_path, initial_data)
 
-            versions = updater._extract_lambda_versions(
-                manifest_data, "poemAI-ch/test-lambdas"
-            )
+        updater = VersionsFileUpdater(versions_path)
+        result = updater.update_hash_based_build(
+            "poemAI-ch/poemai-lambdas",
+            "s3://poemai-artifacts/hash-based-manifests/poemai-lambdas/96b50db9f821ac594b65d1d43e421db50e490a76/lambda_versions.yaml",
+        )
 
-            expected = {
-                "poemAI-ch/test-lambdas#lambda1": "abc123def456",
-                "poemAI-ch/test-lambdas#lambda2": "def456ghi789",
-                "poemAI-ch/test-lambdas#lambda3": "ghi789jkl012",
-            }
-            assert versions == expected
+        assert result is True
 
-            # Test with old format (flat structure without versions section)
-            old_format_manifest = {
-                "lambda1": "abc123def456",
-                "lambda2": "def456ghi789",
-            }
-            versions = updater._extract_lambda_versions(
-                old_format_manifest, "poemAI-ch/test-lambdas"
-            )
-            assert versions == {}  # Should return empty dict when no versions section
+        # Verify S3 client was called correctly
+        mock_boto3.client.assert_called_once_with("s3", region_name="eu-central-2")
+        mock_s3_client.get_object.assert_called_once_with(
+            Bucket="poemai-artifacts",
+            Key="hash-based-manifests/poemai-lambdas/96b50db9f821ac594b65d1d43e421db50e490a76/lambda_versions.yaml",
+        )
 
-            # Empty manifest
-            versions = updater._extract_lambda_versions({}, "poemAI-ch/test-lambdas")
-            assert versions == {}
+        # Check the updated file
+        data = _read_versions_file(versions_path)
 
-            # Invalid manifest format
-            versions = updater._extract_lambda_versions(
-                "not a dict", "poemAI-ch/test-lambdas"
-            )
-            assert versions == {}
+        # Verify structure
+        assert "versions" in data
+        assert "hash_based_lambdas" in data
 
-        finally:
-            os.unlink(temp_file)
+        # Verify specific lambda versions were updated correctly
+        assert (
+            data["versions"]["poemAI-ch/poemai-lambdas#group_summary_builder"]
+            == "d344e6896fe2"
+        )
+        assert data["versions"]["poemAI-ch/poemai-lambdas#auth_proxy"] == "42cc5172fccb"
+        assert (
+            data["versions"]["poemAI-ch/poemai-lambdas#llm_stream_get"]
+            == "9eb7be765a8e"
+        )
+        assert (
+            data["versions"]["poemAI-ch/poemai-lambdas#rule_engine"] == "48136ea57187"
+        )
 
+        # Verify non-lambda versions were preserved
+        assert data["versions"]["poemAI-ch/other-repo"] == "old123"
 
-class TestBuildTypeDetection:
-    """Test cases for build type detection."""
+        # Verify manifest URL was updated
+        assert (
+            data["hash_based_lambdas"]["poemAI-ch/poemai-lambdas"]
+            == "s3://poemai-artifacts/hash-based-manifests/poemai-lambdas/96b50db9f821ac594b65d1d43e421db50e490a76/lambda_versions.yaml"
+        )
 
-    def test_detect_hash_based_build(self):
-        """Test detection of hash-based build."""
-        args = argparse.Namespace(
-            manifest_url="s3://bucket/manifest.json",
-            build_number="123",
-            upstream_sha="",
+    def test_hash_based_build_s3_failure_fallback(self, mock_boto3, versions_path):
+        """Test hash-based build with S3 failure falls back to manifest URL only."""
+        # Setup mock S3 client that raises an error
+        mock_s3_client = mock_boto3.client.return_value
+
+        error_response = {"Error": {"Code": "NoSuchKey", "Message": "Key not found"}}
+        mock_s3_client.get_object.side_effect = ClientError(error_response, "GetObject")
+
+        initial_data = {"versions": {"poemAI-ch/other-repo": "old123"}}
+        _write_versions_file(versions_path, initial_data)
+
+        updater = VersionsFileUpdater(versions_path)
+        result = updater.update_hash_based_build(
+            "poemAI-ch/test-lambdas", "s3://test-bucket/nonexistent.yaml"
         )
-        assert detect_build_type(args) == "hash_based"
 
-    def test_detect_regular_build(self):
-        """Test detection of regular build."""
-        args = argparse.Namespace(
-            manifest_url="", build_number="", upstream_sha="abc123def456"
+        assert result is True
+
+        # Check the updated file - should only have manifest URL, no individual lambdas
+        data = _read_versions_file(versions_path)
+
+        expected = {
+            "versions": {"poemAI-ch/other-repo": "old123"},  # Unchanged
+            "hash_based_lambdas": {
+                "poemAI-ch/test-lambdas": "s3://test-bucket/nonexistent.yaml"
+            },
+        }
+        assert data == expected
+
+    @pytest.mark.parametrize(
+        "s3_url, expected_bucket, expected_key",
+        [
+            ("s3://my-bucket/path/to/file.yaml", "my-bucket", "path/to/file.yaml"),
+            ("s3://test-bucket/manifest.json", "test-bucket", "manifest.json"),
+        ],
+    )
+    def test_parse_s3_url(self, updater, s3_url, expected_bucket, expected_key):
+        """Test S3 URL parsing."""
+        assert updater._parse_s3_url(s3_url) == (expected_bucket, expected_key)
+
+    @pytest.mark.parametrize(
+        "s3_url", ["https://example.com/file.yaml", "s3://bucket-only"]
+    )
+    def test_parse_invalid_s3_url(self, updater, s3_url):
+        """Test that invalid S3 URLs are rejected."""
+        with pytest.raises(ValueError, match="Invalid S3 URL format"):
+            updater._parse_s3_url(s3_url)
+
+    def test_extract_lambda_versions(self, updater):
+        """Test lambda version extraction from manifest data."""
+        # Valid manifest data with versions section (like actual S3 manifest)
+        manifest_data = {
+            "versions": {
+                "lambda1": "abc123def456",
+                "lambda2": "def456ghi789",
+                "lambda3": "ghi789jkl012",
+            },
+            "build_info": {
+                "timestamp": "2024-09-18T10:00:00Z",
+                "commit": "abcd1234",
+            },
+        }
+
+        versions = updater._extract_lambda_versions(
+            manifest_data, "poemAI-ch/test-lambdas"
         )
-        assert detect_build_type(args) == "regular"
 
-    def test_detect_hash_based_with_extra_sha(self):
-        """Test that hash-based takes precedence when both are provided."""
-        args = argparse.Namespace(
-            manifest_url="s3://bucket/manifest.json",
-            build_number="123",
-            upstream_sha="abc123def456",
+        expected = {
+            "poemAI-ch/test-lambdas#lambda1": "abc123def456",
+            "poemAI-ch/test-lambdas#lambda2": "def456ghi789",
+            "poemAI-ch/test-lambdas#lambda3": "ghi789jkl012",
+        }
+        assert versions == expected
+
+        # Test with old format (flat structure without versions section)
+        old_format_manifest = {
+            "lambda1": "abc123def456",
+            "lambda2": "def456ghi789",
+        }
+        versions = updater._extract_lambda_versions(
+            old_format_manifest, "poemAI-ch/test-lambdas"
         )
-        assert detect_build_type(args) == "hash_based"
+        assert versions == {}  # Should return empty dict when no versions section
 
-    def test_invalid_arguments_no_manifest_url(self):
-        """Test invalid arguments when manifest URL is missing but build number is provided."""
-        args = argparse.Namespace(manifest_url="", build_number="123", upstream_sha="")
-        with pytest.raises(ValueError, match="Invalid arguments"):
-            detect_build_type(args)
+        # Empty manifest
+        versions = updater._extract_lambda_versions({}, "poemAI-ch/test-lambdas")
+        assert versions == {}
 
-    def test_invalid_arguments_no_build_number(self):
-        """Test invalid arguments when build number is missing but manifest URL is provided."""
-        args = argparse.Namespace(
-            manifest_url="s3://bucket/manifest.json", build_number="", upstream_sha=""
+        # Invalid manifest format
+        versions = updater._extract_lambda_versions(
+            "not a dict", "poemAI-ch/test-lambdas"
         )
-        with pytest.raises(ValueError, match="Invalid arguments"):
-            detect_build_type(args)
+        assert versions == {}
+
+
+class TestBuildTypeDetection:
+    """Test cases for build type detection."""
 
-    def test_invalid_arguments_nothing_provided(self):
-        """Test invalid arguments when nothing is provided."""
-        args = argparse.Namespace(manifest_url="", build_number="", upstream_sha="")
+    @pytest.mark.parametrize(
+        "manifest_url, build_number, upstream_sha, expected",
+        [
+            pytest.param(
+                "s3://bucket/manifest.json", "123", "", "hash_based", id="hash-based"
+            ),
+            pytest.param("", "", "abc123def456", "regular", id="regular"),
+            # hash-based takes precedence when both are provided
+            pytest.param(
+                "s3://bucket/manifest.json",
+                "123",
+                "abc123def456",
+                "hash_based",
+                id="hash-based-with-extra-sha",
+            ),
+        ],
+    )
+    def test_detect_build_type(
+        self, manifest_url, build_number, upstream_sha, expected
+    ):
+        """Test detection of hash-based and regular builds."""
+        args = argparse.Namespace(
+            manifest_url=manifest_url,
+            build_number=build_number,
+            upstream_sha=upstream_sha,
+        )
+        assert detect_build_type(args) == expected
+
+    @pytest.mark.parametrize(
+        "manifest_url, build_number, upstream_sha",
+        [
+            pytest.param("", "123", "", id="no-manifest-url"),
+            pytest.param("s3://bucket/manifest.json", "", "", id="no-build-number"),
+            pytest.param("", "", "", id="nothing-provided"),
+        ],
+    )
+    def test_invalid_arguments(self, manifest_url, build_number, upstream_sha):
+        """Test invalid argument combinations."""
+        args = argparse.Namespace(
+            manifest_url=manifest_url,
+            build_number=build_number,
+            upstream_sha=upstream_sha,
+        )
         with pytest.raises(ValueError, match="Invalid arguments"):
             detect_build_type(args)
 
@@ -502,12 +432,29 @@ class TestBuildTypeDetection:
 class TestGitHubActionsIntegration:
     """Test GitHub Actions integration features."""
 
-    @patch.dict(os.environ, {"GITHUB_OUTPUT": "/tmp/test_output"})
-    def test_github_output_written(self):
+    def test_github_output_written(self, monkeypatch, tmp_path, versions_path):
         """Test that GitHub Actions outputs are written correctly."""
-        # This would be tested in integration tests with actual CLI calls
-        # For now, we can test that the environment variable is checked
-        assert os.getenv("GITHUB_OUTPUT") == "/tmp/test_output"
+        github_output = tmp_path / "github_output"
+        monkeypatch.setenv("GITHUB_OUTPUT", str(github_output))
+        monkeypatch.setattr(
+            "sys.argv",
+            [
+                "update_versions_file.py",
+                "--versions-file",
+                versions_path,
+                "--upstream-repo",
+                "poemAI-ch/test-repo",
+                "--upstream-sha",
+                "abc123def456",
+            ],
+        )
+
+        main()
+
+        assert github_output.read_text() == "build_type=regular\nfile_updated=true\n"
+        assert _read_versions_file(versions_path) == {
+            "versions": {"poemAI-ch/test-repo": "abc123def456"}
+        }
 
 
 if __name__ == "__main__":
@@ -19,6 +19,13 @@ from typing import Any, Dict, Optional
 
 import yaml
 
+try:
+    from yaml import CSafeDumper as YAML_DUMPER
+    from yaml import CSafeLoader as YAML_LOADER
+except ImportError:
+    from yaml import SafeDumper as YAML_DUMPER
+    from yaml import SafeLoader as YAML_LOADER
+
 try:
     import boto3
     from botocore.exceptions import ClientError, NoCredentialsError
@@ -41,7 +48,7 @@ class VersionsFileUpdater:
         """Load existing versions file or create empty structure."""
         if self.versions_file_path.exists():
             with self.versions_file_path.open("r") as f:
-                self.data = yaml.safe_load(f) or {}
+                self.data = yaml.load(f, Loader=YAML_LOADER) or {}
         else:
             print(f"Creating {self.versions_file_path} with empty versions block.")
             self.data = {}
@@ -54,7 +61,7 @@ class VersionsFileUpdater:
     def _save_file(self) -> None:
         """Save the updated data to the versions file."""
         with self.versions_file_path.open("w") as f:
-            yaml.safe_dump(self.data, f, sort_keys=False)
+            yaml.dump(self.data, f, Dumper=YAML_DUMPER, sort_keys=False)
 
     def _parse_s3_url(self, s3_url: str) -> tuple[str, str]:
         """
@@ -103,7 +110,7 @@ class VersionsFileUpdater:
             manifest_content = response["Body"].read().decode("utf-8")
 
             # Parse YAML
-            manifest_data = yaml.safe_load(manifest_content)
+            manifest_data = yaml.load(manifest_content, Loader=YAML_LOADER)
             print(f"✅ Successfully downloaded and parsed manifest")
             return manifest_data
 
@@ -189,7 +196,7 @@ class VersionsFileUpdater:
         self._save_file()
 
         print("Updated file contents:")
-        print(yaml.safe_dump(self.data, sort_keys=False))
+        print(yaml.dump(self.data, Dumper=YAML_DUMPER, sort_keys=False))
         return True
 
     def update_hash_based_build(self, upstream_repo: str, manifest_url: str) -> bool:
@@ -263,7 +270,7 @@ class VersionsFileUpdater:
         if manifest_updated or lambda_versions_updated:
             self._save_file()
             print("Updated file contents:")
-            print(yaml.safe_dump(self.data, sort_keys=False))
+            print(yaml.dump(self.data, Dumper=YAML_DUMPER, sort_keys=False))
             return True
         else:
             print(
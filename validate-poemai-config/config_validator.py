@@ -1,6 +1,7 @@
 import argparse
 import json
 import logging
+import os
 import sys
 from collections import defaultdict
 from enum import Enum
@@ -11,6 +12,11 @@ import yaml
 from poemai_utils.enum_utils import add_enum_repr
 from poemai_utils.openai.openai_model import OPENAI_MODEL
 
+try:
+    from yaml import CSafeLoader as YAML_LOADER
+except ImportError:
+    from yaml import SafeLoader as YAML_LOADER
+
 _logger = logging.getLogger(__name__)
 
 
@@ -577,6 +583,18 @@ def calc_environment_path(project_root_path, environment):
     return path
 
 
+def find_config_files(path):
+    """
+    Find the yaml config files of an environment directory. Like Path.rglob,
+    os.walk does not descend into symlinked directories.
+    """
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.endswith((".yaml", ".yml")):
+                yield Path(dirpath, filename)
+
+
 def validate_files(project_root_path, environment):
 
     validation_errors = defaultdict(list)
@@ -588,14 +606,14 @@ def validate_files(project_root_path, environment):
 
     all_objects = []
     all_objects_with_file = []
-    for file in list(path.rglob("*.yaml")) + list(path.rglob("*.yml")):
+    for file in find_config_files(path):
         file_identifier = file.as_posix()
 
         try:
             with open(file, "rb") as f:
                 had_error = False
                 try:
-                    data = yaml.safe_load(f)
+                    data = yaml.load(f, Loader=YAML_LOADER)
                     all_objects.append(data)
                     all_objects_with_file.append((data, file_identifier))
                 except yaml.composer.ComposerError as e:
@@ -603,7 +621,7 @@ def validate_files(project_root_path, environment):
 
                 if had_error:
                     f.seek(0)
-                    data = yaml.safe_load_all(f)
+                    data = yaml.load_all(f, Loader=YAML_LOADER)
                     for d in data:
                         all_objects.append(d)
                         all_objects_with_file.append((d, file_identifier))
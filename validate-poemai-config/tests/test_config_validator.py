@@ -29,7 +29,7 @@ except ImportError:
     sys.modules["poemai_utils.openai"] = openai_module
     sys.modules["poemai_utils.openai.openai_model"] = openai_model_module
 
-from config_validator import calc_object_directory, validate
+from config_validator import calc_object_directory, find_config_files, validate
 
 
 def _assistant_object(model_name):
@@ -165,3 +165,18 @@ def test_tool_output_rendering_accepts_explicit_raw_opt_in():
         corpus_metadata_obj=_corpus_metadata_object(),
     )
     assert "assistant.yaml" not in errors
+
+
+def test_find_config_files_skips_symlinked_directories(tmp_path):
+    (tmp_path / "BOT_A").mkdir()
+    (tmp_path / "BOT_A" / "assistant.yaml").write_text("a: 1\n")
+    (tmp_path / "BOT_A" / "metadata.yml").write_text("b: 2\n")
+    outside = tmp_path.parent / f"{tmp_path.name}_outside"
+    outside.mkdir()
+    (outside / "other.yaml").write_text("c: 3\n")
+    (tmp_path / "linked").symlink_to(outside, target_is_directory=True)
+    (tmp_path / "BOT_A" / "loop").symlink_to(tmp_path, target_is_directory=True)
+
+    found = [p.relative_to(tmp_path).as_posix() for p in find_config_files(tmp_path)]
+
+    assert found == ["BOT_A/assistant.yaml", "BOT_A/metadata.yml"]